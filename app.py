@@ -5,48 +5,187 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
 from werkzeug.middleware.proxy_fix import ProxyFix
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+from sqlalchemy.engine import make_url
+from replica import REPLICA_BIND, RoutingSession
 
 class Base(DeclarativeBase):
     pass
 
-# Initialize database
-db = SQLAlchemy(model_class=Base)
-
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "ai-chatbot-dashboard-secret-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate https URLs
-
-# Configure database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    'pool_pre_ping': True,
-    "pool_recycle": 300,
-}
-
-# Initialize database with app
-db.init_app(app)
+# Initialize database; read-only views may be routed to a replica (see replica.py)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 # Setup login manager
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import Business
-    return Business.query.get(int(user_id))
+    from usercache import user_cache
+    return user_cache.load(int(user_id))
+
+_listeners_registered = False
+
+def _register_listeners():
+    """Install every module's SQLAlchemy event listeners, once per process
+
+    They hang off the models, Session, the metadata and Engine, which are
+    shared by every app create_app builds (tests and scripts build several).
+    """
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    _listeners_registered = True
+    
+    import availability, cache, dataversion, metrics, partitions, querycount, replica, rollups, search
+    for module in (cache, rollups, dataversion, search, partitions, availability, querycount, metrics, replica):
+        module.register_listeners()
 
-with app.app_context():
-    # Import models
-    import models  # noqa: F401
+def _engine_options(app, url, name):
+    options = {'pool_pre_ping': True, 'pool_recycle': 300, 'pool_logging_name': name}
+    url = make_url(url)
+    # In-memory SQLite keeps the single shared connection Flask-SQLAlchemy gives it
+    if url.get_backend_name() != 'sqlite' or url.database not in (None, '', ':memory:'):
+        options.update(
+            pool_size=app.config["DB_POOL_SIZE"],
+            max_overflow=app.config["DB_MAX_OVERFLOW"],
+            pool_timeout=app.config["DB_POOL_TIMEOUT"],
+        )
+    return options
+
+def create_app(config=None):
+    """Build the Flask app; config overrides the settings read from the environment"""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "ai-chatbot-dashboard-secret-key")
+    # Reverse proxies in front of the app whose X-Forwarded-* headers are trusted (for client IPs, used by
+    # the login rate limiter, and for https URLs); with none, those headers could be forged by any client
+    app.config["TRUSTED_PROXIES"] = int(os.environ.get("TRUSTED_PROXIES", 0))
+    
+    # Log level for the app and its libraries; DEBUG logs every request and is slow
+    app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO").upper()
+    
+    # Configure database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Per worker process: up to DB_POOL_SIZE kept-open connections plus DB_MAX_OVERFLOW
+    # extra ones; a request waits DB_POOL_TIMEOUT seconds for one before failing
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 5))
+    app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    app.config["DB_POOL_TIMEOUT"] = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    # Optional read replica for dashboard, chart and listing queries; clients that just
+    # wrote keep reading from the primary for REPLICA_STICKY_SECONDS
+    app.config["DATABASE_REPLICA_URL"] = os.environ.get("DATABASE_REPLICA_URL")
+    app.config["REPLICA_STICKY_SECONDS"] = int(os.environ.get("REPLICA_STICKY_SECONDS", 10))
+    
+    # Configure dashboard statistics cache (STATS_CACHE_TTL=0 disables it)
+    app.config["STATS_CACHE_TTL"] = int(os.environ.get("STATS_CACHE_TTL", 30))
+    app.config["STATS_CACHE_SIZE"] = int(os.environ.get("STATS_CACHE_SIZE", 1024))
+    app.config["STATS_CACHE_URL"] = os.environ.get("STATS_CACHE_URL")
+    
+    # Threads used to compute the dashboard's three statistics concurrently (0 = one after another)
+    app.config["STATS_WORKERS"] = int(os.environ.get("STATS_WORKERS", 6))
+    
+    # Read statistics from the daily rollup tables (enable once `flask backfill-rollups` has run)
+    app.config["STATS_USE_ROLLUPS"] = os.environ.get("STATS_USE_ROLLUPS", "").lower() in ("1", "true", "yes")
+    
+    # Password hashing: any werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000";
+    # older hashes are upgraded at login. Checks run in PASSWORD_WORKERS processes (0 = in the request thread)
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    app.config["PASSWORD_WORKERS"] = int(os.environ.get("PASSWORD_WORKERS", 2))
+    app.config["PASSWORD_MAX_PENDING"] = int(os.environ.get("PASSWORD_MAX_PENDING", 16))
+    # Login attempts allowed per email and per client IP: a burst, refilled at a steady rate
+    app.config["LOGIN_ATTEMPTS_BURST"] = int(os.environ.get("LOGIN_ATTEMPTS_BURST", 10))
+    app.config["LOGIN_ATTEMPTS_PER_MINUTE"] = float(os.environ.get("LOGIN_ATTEMPTS_PER_MINUTE", 10))
+    
+    # Seconds a logged-in business is cached between requests (0 = load it on every request)
+    app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", 30))
+    
+    # Messages are partitioned by month on PostgreSQL; partitions are kept ready this many months ahead
+    app.config["MESSAGE_PARTITIONS_AHEAD"] = int(os.environ.get("MESSAGE_PARTITIONS_AHEAD", 3))
+    # `flask archive-interactions` moves conversations older than this into compressed files under ARCHIVE_DIR,
+    # an absolute path on storage every instance mounts and that outlives them (autoscale instances' own
+    # disks are neither); archiving refuses to run without it
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.environ.get("ARCHIVE_AFTER_DAYS", 365))
+    app.config["ARCHIVE_DIR"] = os.environ.get("ARCHIVE_DIR")
+    
+    # Businesses whose booking availability index each worker keeps in memory
+    app.config["AVAILABILITY_INDEX_SIZE"] = int(os.environ.get("AVAILABILITY_INDEX_SIZE", 256))
+    
+    # Fail requests issuing more SQL statements than this (0 = off); used in tests to catch N+1 queries
+    app.config["QUERY_BUDGET"] = int(os.environ.get("QUERY_BUDGET", 0))
+    
+    # Log SQL statements slower than this many milliseconds (0 = off)
+    app.config["SLOW_QUERY_MS"] = int(os.environ.get("SLOW_QUERY_MS", 0))
+    # Require this bearer token on /metrics; without one it only answers requests from localhost
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+    
+    # Live chat messages are buffered and written in batches (see writebehind.py)
+    app.config["MESSAGE_QUEUE_SIZE"] = int(os.environ.get("MESSAGE_QUEUE_SIZE", 10000))
+    app.config["MESSAGE_FLUSH_INTERVAL"] = float(os.environ.get("MESSAGE_FLUSH_INTERVAL", 0.5))
+    app.config["MESSAGE_FLUSH_BATCH"] = int(os.environ.get("MESSAGE_FLUSH_BATCH", 500))
+    app.config["MESSAGE_MAX_ATTEMPTS"] = int(os.environ.get("MESSAGE_MAX_ATTEMPTS", 3))
+    
+    # Chatbot replies: 'openai' (the default, needs OPENAI_API_KEY) or 'fake' for local runs
+    app.config["CHAT_MODEL_BACKEND"] = os.environ.get("CHAT_MODEL_BACKEND")
+    app.config["CHAT_MODEL"] = os.environ.get("CHAT_MODEL", "gpt-4o-mini")
+    # Prompts carry the last CHAT_CONTEXT_MESSAGES messages plus a summary extended every CHAT_SUMMARY_EVERY messages
+    app.config["CHAT_CONTEXT_MESSAGES"] = int(os.environ.get("CHAT_CONTEXT_MESSAGES", 20))
+    app.config["CHAT_SUMMARY_EVERY"] = int(os.environ.get("CHAT_SUMMARY_EVERY", 20))
+    # Threads per process extending those summaries in the background; 0 folds in the request (tests)
+    app.config["CHAT_SUMMARY_WORKERS"] = int(os.environ.get("CHAT_SUMMARY_WORKERS", 1))
+    app.config["CHAT_TOKEN_BUDGET"] = int(os.environ.get("CHAT_TOKEN_BUDGET", 3000))
+    
+    if config:
+        app.config.update(config)
+    
+    if app.config["SQLALCHEMY_DATABASE_URI"]:
+        app.config.setdefault(
+            "SQLALCHEMY_ENGINE_OPTIONS", _engine_options(app, app.config["SQLALCHEMY_DATABASE_URI"], "primary")
+        )
+    replica_url = app.config["DATABASE_REPLICA_URL"]
+    if replica_url:
+        app.config.setdefault("SQLALCHEMY_BINDS", {
+            REPLICA_BIND: {**_engine_options(app, replica_url, REPLICA_BIND), "url": replica_url}
+        })
+    
+    proxies = app.config["TRUSTED_PROXIES"]
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+    
+    logging.basicConfig(level=app.config["LOG_LEVEL"])
+    
+    # Initialize database with app
+    db.init_app(app)
+    
+    # Setup login manager
+    login_manager.init_app(app)
+    
+    with app.app_context():
+        # Models are imported here rather than at module import, so importing
+        # app (e.g. from a CLI command or script) stays cheap
+        import models  # noqa: F401
+        
+        # Cache invalidation and rollup maintenance hooks need the models
+        _register_listeners()
+        from cache import stats_cache
+        stats_cache.init_app(app)
+        from passwords import password_hasher
+        password_hasher.init_app(app)
+        from usercache import user_cache
+        user_cache.init_app(app)
+        from availability import availability
+        availability.init_app(app)
+        import querycount
+        querycount.init_app(app)
+        import metrics
+        metrics.init_app(app)
+        from writebehind import message_writer
+        message_writer.init_app(app)
+    
+    # Tables are no longer created here; run `flask --app main init-db` when deploying
+    from routes import bp
+    app.register_blueprint(bp)
+    import commands
+    commands.init_app(app)
     
-    logger.info("Creating database tables...")
-    db.create_all()
-    logger.info("Database tables created successfully.")
\ No newline at end of file
+    return app
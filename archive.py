@@ -0,0 +1,161 @@
+"""Archival of old interactions into compressed per-business, per-month files.
+
+archive_interactions() moves every interaction that started before a
+cutoff, with its messages, out of the live tables. Each conversation is
+appended as one JSON line to ARCHIVE_DIR/<business id>/<YYYY-MM>.jsonl.gz
+(one gzip member per batch), recorded in ArchivedInteraction and deleted,
+one transaction per batch. Files are fsynced before the delete commits, so
+a crash can leave a conversation in both places but never in neither; a
+rerun archives it again and readers take its last copy in the file.
+
+The rows are deleted from the database, so ARCHIVE_DIR must be durable
+storage shared by every instance (e.g. a mounted network volume), not an
+instance's own disk; archiving refuses to run until it is set to an
+absolute path.
+
+ArchivedInteraction keeps each interaction's business, type and start
+time, so the statistics and a rebuild of the daily rollups go on counting
+archived interactions. Archived conversations are shown by
+interaction_detail but are not searchable.
+"""
+import gzip
+import json
+import os
+from datetime import datetime
+from itertools import groupby
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from app import db
+from cache import mark_dirty
+from models import ArchivedInteraction, Customer, Interaction, Message, SummaryCheckpoint
+
+INTERACTION_FIELDS = ('id', 'business_id', 'customer_id', 'interaction_type', 'start_time', 'end_time',
+                      'duration', 'summary', 'created_at')
+MESSAGE_FIELDS = ('id', 'sender_type', 'content', 'timestamp')
+TIME_FIELDS = {'start_time', 'end_time', 'created_at', 'timestamp'}
+
+
+class ArchiveNotConfigured(Exception):
+    """ARCHIVE_DIR isn't set to an absolute path"""
+
+
+def archive_dir():
+    directory = current_app.config.get('ARCHIVE_DIR')
+    if not directory or not os.path.isabs(directory):
+        raise ArchiveNotConfigured(
+            "Set ARCHIVE_DIR to an absolute path on durable storage shared by every instance"
+        )
+    return directory
+
+
+def _archive_path(business_id, month):
+    return os.path.join(archive_dir(), str(business_id), f'{month}.jsonl.gz')
+
+
+def _encode(row, fields):
+    return {
+        field: value.isoformat() if field in TIME_FIELDS and value is not None else value
+        for field, value in zip(fields, (getattr(row, field) for field in fields))
+    }
+
+
+def _decode(record):
+    return SimpleNamespace(**{
+        field: datetime.fromisoformat(value) if field in TIME_FIELDS and value is not None else value
+        for field, value in record.items()
+    })
+
+
+def _append(path, lines):
+    """Append the lines to the archive as a new gzip member and wait until they are on disk"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+            archive.write(''.join(lines).encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _archive_batch(interactions):
+    ids = [interaction.id for interaction in interactions]
+    messages = {
+        interaction_id: list(rows)
+        for interaction_id, rows in groupby(db.session.execute(
+            select(Message.interaction_id, *(getattr(Message, field) for field in MESSAGE_FIELDS))
+            .where(Message.interaction_id.in_(ids))
+            .order_by(Message.interaction_id, Message.timestamp, Message.id)
+        ), key=lambda row: row.interaction_id)
+    }
+
+    files = {}
+    for interaction in interactions:
+        record = _encode(interaction, INTERACTION_FIELDS)
+        record['messages'] = [_encode(message, MESSAGE_FIELDS) for message in messages.get(interaction.id, ())]
+        key = (interaction.business_id, interaction.start_time.strftime('%Y-%m'))
+        # Keep "id" first: readers match lines on that prefix before parsing them
+        files.setdefault(key, []).append(json.dumps(record) + '\n')
+    for (business_id, month), lines in files.items():
+        _append(_archive_path(business_id, month), lines)
+
+    db.session.execute(insert(ArchivedInteraction), [{
+        'id': interaction.id,
+        'business_id': interaction.business_id,
+        'customer_id': interaction.customer_id,
+        'interaction_type': interaction.interaction_type,
+        'start_time': interaction.start_time,
+        'archive': interaction.start_time.strftime('%Y-%m'),
+    } for interaction in interactions])
+    db.session.execute(delete(SummaryCheckpoint).where(SummaryCheckpoint.interaction_id.in_(ids)))
+    db.session.execute(delete(Message).where(Message.interaction_id.in_(ids)))
+    db.session.execute(delete(Interaction).where(Interaction.id.in_(ids)))
+    mark_dirty(db.session, {interaction.business_id for interaction in interactions})
+
+
+def archive_interactions(cutoff, batch_size=500):
+    """Archive the interactions that started before cutoff, committing once per batch
+
+    Yields the number of interactions archived after each batch.
+    """
+    archive_dir()
+    done = 0
+    while True:
+        interactions = db.session.execute(
+            select(*(getattr(Interaction, field) for field in INTERACTION_FIELDS))
+            .where(Interaction.start_time < cutoff).order_by(Interaction.id).limit(batch_size)
+        ).all()
+        if not interactions:
+            break
+        try:
+            _archive_batch(interactions)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        done += len(interactions)
+        yield done
+
+
+def load_archived(business_id, interaction_id):
+    """The archived interaction (with its customer) and its messages, or None if it isn't archived"""
+    archived = db.session.execute(
+        select(ArchivedInteraction).where(
+            ArchivedInteraction.id == interaction_id, ArchivedInteraction.business_id == business_id
+        )
+    ).scalar()
+    if archived is None:
+        return None
+
+    prefix = f'{{"id": {interaction_id},'
+    record = None
+    with gzip.open(_archive_path(business_id, archived.archive), 'rt') as archive:
+        for line in archive:
+            if line.startswith(prefix):
+                record = json.loads(line)  # a later copy (from a rerun) replaces an earlier one
+    if record is None:
+        return None
+
+    messages = [_decode(message) for message in record.pop('messages')]
+    interaction = _decode(record)
+    interaction.customer = db.session.get(Customer, interaction.customer_id)
+    return interaction, messages
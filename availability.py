@@ -0,0 +1,258 @@
+"""Free-slot and conflict queries over a business's bookings.
+
+Each process keeps, per business, an index of the bookings that occupy time
+(everything not cancelled) as (start, end, id) tuples sorted by start, plus
+the longest duration seen. Every booking overlapping [a, b) starts in
+[a - longest, b), so a query is one bisect and a scan of the k candidates
+after it rather than a read of every booking.
+
+BookingVersion holds a per-business counter that every commit changing
+bookings bumps in the same transaction. A query compares it with the
+version its index was built at (one primary-key lookup) and rebuilds a
+stale index. Commits made through this process's ORM session patch the
+index in place when it was current just before them, so the chatbot sees
+its own bookings at once without a rebuild. Core and bulk writes to Booking
+skip the ORM events and must call bookings_changed().
+"""
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert, inspect, select, update
+from sqlalchemy.orm import Session
+from app import db
+from models import Booking, BookingVersion
+from rollups import UPSERT_DIALECTS
+
+# Bookings without a duration still hold the slot they were made for
+DEFAULT_DURATION_MINUTES = 30
+# Bookings further back than this are not indexed; queries are clamped to the window
+LOOKBACK = timedelta(days=1)
+# Booking columns the index depends on; other updates (notes, service) leave it alone
+INDEXED_ATTRS = ('business_id', 'booking_time', 'duration', 'status')
+
+
+def _interval(booking_time, duration):
+    return booking_time, booking_time + timedelta(minutes=duration or DEFAULT_DURATION_MINUTES)
+
+
+class BookingIndex:
+    """Sorted intervals of one business's bookings from `since` onward"""
+
+    def __init__(self, version, since, rows=()):
+        self.version = version
+        self.since = since
+        self.entries = []
+        self.by_id = {}
+        self.longest = timedelta(minutes=DEFAULT_DURATION_MINUTES)
+        self.lock = threading.Lock()
+        for booking_id, booking_time, duration in rows:
+            self.add(booking_id, *_interval(booking_time, duration))
+
+    def add(self, booking_id, start, end):
+        self.remove(booking_id)
+        if end <= self.since:
+            return
+        entry = (start, end, booking_id)
+        bisect.insort(self.entries, entry)
+        self.by_id[booking_id] = entry
+        # Never shrunk on removal: a longer bound only widens the candidate scan
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, booking_id):
+        entry = self.by_id.pop(booking_id, None)
+        if entry is not None:
+            del self.entries[bisect.bisect_left(self.entries, entry)]
+
+    def overlapping(self, start, end):
+        """(start, end, id) of the bookings overlapping [start, end), in start order"""
+        first = bisect.bisect_left(self.entries, (start - self.longest,))
+        last = bisect.bisect_left(self.entries, (end,))
+        return [entry for entry in self.entries[first:last] if entry[1] > start]
+
+    def free(self, start, end, min_length):
+        """The gaps of at least min_length between bookings in [start, end)"""
+        gaps = []
+        cursor = start
+        for busy_start, busy_end, _ in self.overlapping(start, end):
+            if busy_start - cursor >= min_length:
+                gaps.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        if end - cursor >= min_length:
+            gaps.append((cursor, end))
+        return gaps
+
+
+class AvailabilityService:
+    def __init__(self, max_businesses=256):
+        self.max_businesses = max_businesses
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_businesses = app.config.get('AVAILABILITY_INDEX_SIZE', self.max_businesses)
+
+    def _current_version(self, business_id):
+        return db.session.execute(
+            select(BookingVersion.version).where(BookingVersion.business_id == business_id)
+        ).scalar() or 0
+
+    def _build(self, business_id, version):
+        since = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - LOOKBACK
+        rows = db.session.execute(
+            select(Booking.id, Booking.booking_time, Booking.duration).where(
+                Booking.business_id == business_id,
+                Booking.status != 'cancelled',
+                # Anything shorter than LOOKBACK that reaches into the window starts after this
+                Booking.booking_time >= since - LOOKBACK
+            )
+        ).all()
+        return BookingIndex(version, since, rows)
+
+    def index(self, business_id):
+        """The business's index, rebuilt first if bookings changed since it was built"""
+        # Read the version before the bookings: a commit in between leaves the
+        # index newer than its version, which only costs an extra rebuild
+        version = self._current_version(business_id)
+        with self._lock:
+            index = self._indexes.get(business_id)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(business_id)
+                return index
+
+        index = self._build(business_id, version)
+        with self._lock:
+            current = self._indexes.get(business_id)
+            if current is None or current.version < version:
+                self._indexes[business_id] = index
+            self._indexes.move_to_end(business_id)
+            while len(self._indexes) > self.max_businesses:
+                self._indexes.popitem(last=False)
+        return index
+
+    def free_slots(self, business_id, start, end, duration):
+        """Free intervals of at least `duration` minutes between start and end"""
+        index = self.index(business_id)
+        start = max(start, index.since)
+        if end <= start:
+            return []
+        with index.lock:
+            return index.free(start, end, timedelta(minutes=duration))
+
+    def conflicts(self, business_id, start, duration):
+        """Ids of the bookings that a booking of `duration` minutes at start would overlap"""
+        index = self.index(business_id)
+        start, end = _interval(start, duration)
+        with index.lock:
+            return [booking_id for _, _, booking_id in index.overlapping(max(start, index.since), end)]
+
+    def _apply(self, versions, changes):
+        """Patch indexes that were current before this commit; drop ones that missed other commits"""
+        with self._lock:
+            for business_id, version in versions.items():
+                index = self._indexes.get(business_id)
+                if index is None:
+                    continue
+                by_booking = changes.get(business_id)
+                if index.version != version - 1 or by_booking is None:
+                    del self._indexes[business_id]
+                    continue
+                with index.lock:
+                    for booking_id, interval in by_booking.items():
+                        if interval is None:
+                            index.remove(booking_id)
+                        else:
+                            index.add(booking_id, *interval)
+                    index.version = version
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+availability = AvailabilityService()
+
+
+def bookings_changed(session, business_ids):
+    """Bump the businesses' booking versions at commit, for writes that skip the ORM events"""
+    changes = session.info.setdefault('availability_changes', {})
+    for business_id in business_ids:
+        # The changed bookings aren't known, so their indexes are rebuilt instead of patched
+        changes[business_id] = None
+
+
+def _record(target, business_id, interval):
+    session = inspect(target).session
+    if session is None:
+        return
+    by_booking = session.info.setdefault('availability_changes', {}).setdefault(business_id, {})
+    if by_booking is not None:
+        by_booking[target.id] = interval
+
+
+def _bump_versions(connection, business_ids):
+    """Add one to each business's booking version and return the new versions"""
+    rows = [{'business_id': business_id, 'version': 1} for business_id in sorted(business_ids)]
+
+    dialect_insert = UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(BookingVersion).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['business_id'],
+            set_={'version': BookingVersion.version + 1}
+        ).returning(BookingVersion.business_id, BookingVersion.version)
+        return dict(connection.execute(stmt).all())
+
+    connection.execute(
+        update(BookingVersion).where(BookingVersion.business_id.in_(business_ids))
+        .values(version=BookingVersion.version + 1)
+    )
+    versions = dict(connection.execute(
+        select(BookingVersion.business_id, BookingVersion.version).where(BookingVersion.business_id.in_(business_ids))
+    ).all())
+    missing = [row for row in rows if row['business_id'] not in versions]
+    if missing:
+        connection.execute(insert(BookingVersion), missing)
+        versions.update((row['business_id'], 1) for row in missing)
+    return versions
+
+
+def register_listeners():
+    """Track booking changes per session and apply them to the indexes after commit"""
+    def booking_written(mapper, connection, target):
+        state = inspect(target)
+        if not any(state.attrs[name].history.has_changes() for name in INDEXED_ATTRS):
+            return
+        history = state.attrs.business_id.history
+        for business_id in history.deleted:
+            if business_id != target.business_id:
+                _record(target, business_id, None)
+        active = target.status != 'cancelled'
+        _record(target, target.business_id, _interval(target.booking_time, target.duration) if active else None)
+
+    def booking_deleted(mapper, connection, target):
+        _record(target, target.business_id, None)
+
+    event.listen(Booking, 'after_insert', booking_written)
+    event.listen(Booking, 'after_update', booking_written)
+    event.listen(Booking, 'after_delete', booking_deleted)
+
+    @event.listens_for(Session, 'before_commit')
+    def bump_versions(session):
+        session.flush()
+        changes = session.info.get('availability_changes')
+        if changes:
+            # The row locks taken here are held until commit, so versions never skip a writer
+            session.info['availability_versions'] = _bump_versions(session.connection(), set(changes))
+
+    @event.listens_for(Session, 'after_commit')
+    def apply_changes(session):
+        changes = session.info.pop('availability_changes', None)
+        versions = session.info.pop('availability_versions', None)
+        if versions:
+            availability._apply(versions, changes)
+
+    @event.listens_for(Session, 'after_rollback')
+    def discard_changes(session):
+        session.info.pop('availability_changes', None)
+        session.info.pop('availability_versions', None)
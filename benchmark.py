@@ -0,0 +1,245 @@
+"""Benchmark the dashboard statistics and every GET route against a seeded database.
+
+Seed first, then run against the same DATABASE_URL:
+
+    flask --app main seed-data --businesses 10 --interactions 1000000
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+
+The JSON report is stable across runs so reports from two commits can be
+diffed. Each request result records the status codes it got and the last
+exception raised, and counts the rounds that failed (an exception or a
+status of 400 or more). --compare exits non-zero when a route fails more
+rounds or issues more statements than in the baseline, or its median
+regresses past --threshold.
+
+The `concurrent.*` results compare the sync path with the concurrent one:
+the dashboard's three stats computed back to back versus with
+utils.gather_stats, and --clients users loading the three chart endpoints
+one request at a time (a sync worker) versus all at once (a threaded one).
+
+This is a script rather than a pytest-benchmark suite because it measures
+a database seeded at production scale, not the small throwaway databases
+the tests run on; the statement-count checks that do fit there live in
+tests/test_query_counts.py.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import func
+
+from main import app
+from app import db
+from cache import stats_cache
+from models import Business, Interaction, Message, Booking
+from querycount import QueryCounter
+from utils import get_interaction_stats, get_booking_stats, get_customer_stats, gather_stats
+
+CHART_URLS = ['/api/charts/interactions', '/api/charts/bookings', '/api/charts/customer-types']
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _time(callback, rounds, requests=False):
+    """Run callback rounds times, each in a fresh app context, and summarise the timings
+
+    With requests=True the callback returns the status codes of the requests
+    it made, and a round fails when one of them is 400 or more. A round that
+    raises fails too and is still timed.
+    """
+    timings = []
+    statements = 0
+    statuses = set()
+    errors = 0
+    error = None
+    for _ in range(rounds):
+        with app.app_context(), QueryCounter(db.engine) as counter:
+            start = time.perf_counter()
+            try:
+                outcome = callback()
+            except Exception as e:
+                errors += 1
+                error = f'{type(e).__name__}: {e}'
+            else:
+                if requests:
+                    statuses.update(outcome)
+                    errors += any(status >= 400 for status in outcome)
+            timings.append(time.perf_counter() - start)
+        statements = counter.count
+
+    timings.sort()
+    return {
+        'rounds': rounds,
+        'min_ms': round(timings[0] * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        'statements': statements,
+        'status': sorted(statuses),
+        'errors': errors,
+        'error': error,
+    }
+
+
+def _route_urls(business_id):
+    urls = [
+        rule.rule for rule in app.url_map.iter_rules()
+        if 'GET' in rule.methods and not rule.arguments and rule.endpoint not in ('static', 'main.logout')
+    ]
+    interaction = Interaction.query.filter_by(business_id=business_id).order_by(Interaction.id).first()
+    if interaction:
+        urls.append(f'/dashboard/interaction/{interaction.id}')
+    return sorted(urls)
+
+
+def _login_client(business_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(business_id)
+        session['_fresh'] = True
+    return client
+
+
+def _request(client, url):
+    return client.get(url).status_code
+
+
+def _request_in_context(client, url):
+    with app.app_context():
+        return _request(client, url)
+
+
+def run(business_id, rounds):
+    results = {}
+
+    for stats_function in (get_interaction_stats, get_booking_stats, get_customer_stats):
+        results[f'utils.{stats_function.__name__}'] = _time(lambda: stats_function(business_id), rounds)
+
+    client = _login_client(business_id)
+    for url in _route_urls(business_id):
+        results[f'GET {url}'] = _time(lambda: [_request(client, url)], rounds, requests=True)
+
+    return results
+
+
+def run_concurrent(business_id, rounds, clients):
+    """Time the sync and concurrent ways of serving the dashboard statistics"""
+    stats_functions = (get_interaction_stats, get_booking_stats, get_customer_stats)
+    results = {
+        'concurrent.dashboard_stats.sequential': _time(
+            lambda: [stats_function(business_id) for stats_function in stats_functions], rounds
+        ),
+        'concurrent.dashboard_stats.gather_stats': _time(lambda: gather_stats(business_id), rounds),
+    }
+
+    client_list = [_login_client(business_id) for _ in range(clients)]
+    requests = [(client, url) for client in client_list for url in CHART_URLS]
+    with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+        # Fresh app context per request, as the threaded run gets one per thread
+        results[f'concurrent.charts.{clients}_clients.sequential'] = _time(
+            lambda: [_request_in_context(client, url) for client, url in requests], rounds, requests=True
+        )
+        results[f'concurrent.charts.{clients}_clients.threaded'] = _time(
+            lambda: list(pool.map(lambda request: _request_in_context(*request), requests)), rounds, requests=True
+        )
+    return results
+
+
+def compare(report, baseline, threshold, min_delta_ms):
+    """Print the change of every median against baseline and return the regressions
+
+    A result regresses when it fails more rounds or issues more statements
+    than before, or when its median grows by more than threshold times and by
+    at least min_delta_ms.
+    """
+    regressions = []
+    for name, result in sorted(report['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None or not before['median_ms']:
+            print(f"{'new':>8}  {name}")
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        failed = result['errors'] > before.get('errors', 0)
+        regressed = failed or result['statements'] > before['statements'] or (
+            ratio > threshold and result['median_ms'] - before['median_ms'] >= min_delta_ms
+        )
+        marker = ' REGRESSION' if regressed else ''
+        print(f"{ratio:>7.2f}x  {name} ({before['median_ms']} -> {result['median_ms']} ms, "
+              f"{before['statements']} -> {result['statements']} statements){marker}")
+        if failed:
+            print(f"          {result['errors']} of {result['rounds']} rounds failed "
+                  f"(status {result['status']}, last error: {result['error']})")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--business-id', type=int, help='Tenant to benchmark (defaults to the largest one).')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=4, help='Simultaneous users in the concurrent chart benchmark.')
+    parser.add_argument('--with-cache', action='store_true', help='Leave the stats cache on (off by default).')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--compare', help='Baseline JSON report to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Median ratio counted as a regression.')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Ignore median changes smaller than this.')
+    args = parser.parse_args()
+
+    stats_cache.enabled = args.with_cache
+
+    with app.app_context():
+        business_id = args.business_id
+        if business_id is None:
+            business_id = db.session.query(Interaction.business_id).group_by(
+                Interaction.business_id
+            ).order_by(func.count().desc()).limit(1).scalar()
+        if business_id is None:
+            sys.exit('No interactions found; run `flask --app main seed-data` first.')
+
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'created_at': datetime.utcnow().isoformat(),
+                'database': db.engine.dialect.name,
+                'business_id': business_id,
+                'with_cache': args.with_cache,
+                'rows': {
+                    'business': Business.query.count(),
+                    'interaction': Interaction.query.filter_by(business_id=business_id).count(),
+                    'message': Message.query.join(Interaction).filter(Interaction.business_id == business_id).count(),
+                    'booking': Booking.query.filter_by(business_id=business_id).count(),
+                },
+            },
+        }
+
+        report['results'] = run(business_id, args.rounds)
+        report['results'].update(run_concurrent(business_id, args.rounds, args.clients))
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold, args.min_delta_ms):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from sqlalchemy import event, inspect, select, union
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBackend:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries=1024, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, business_id):
+        with self._lock:
+            return self._generations.get(business_id, 0)
+
+    def get(self, business_id, name, generation):
+        key = (business_id, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, business_id, name, value, generation):
+        key = (business_id, name)
+        with self._lock:
+            if self._generations.get(business_id, 0) != generation:
+                return  # invalidated while the value was computed
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, business_id):
+        with self._lock:
+            self._generations[business_id] = self._generations.get(business_id, 0) + 1
+            for key in [key for key in self._entries if key[0] == business_id]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DictClient:
+    """Local stand-in for a shared key-value server, exposing the redis-py calls we use"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else None, value)
+
+    def incr(self, key):
+        with self._lock:
+            _, value = self._data.get(key, (None, 0))
+            self._data[key] = (None, int(value) + 1)
+            return int(value) + 1
+
+    def dbsize(self):
+        return len(self._data)
+
+
+class SharedBackend:
+    """Cache stored in a shared key-value server so all workers see the same entries
+
+    Invalidation bumps a per-business generation number that is part of every
+    key, so stale entries are never read again and simply expire.
+    """
+
+    def __init__(self, client, ttl=30, prefix='stats'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def generation(self, business_id):
+        return int(self.client.get(f'{self.prefix}:{business_id}:gen') or 0)
+
+    def _key(self, business_id, name, generation):
+        return f'{self.prefix}:{business_id}:{generation}:{name}'
+
+    def get(self, business_id, name, generation):
+        value = self.client.get(self._key(business_id, name, generation))
+        if value is None:
+            return False, None
+        return True, json.loads(value)
+
+    def set(self, business_id, name, value, generation):
+        # Filed under the generation read before computing: if it was invalidated
+        # meanwhile, the value lands under a key nobody reads and just expires
+        self.client.set(self._key(business_id, name, generation), json.dumps(value), ex=self.ttl)
+
+    def invalidate(self, business_id):
+        self.client.incr(f'{self.prefix}:{business_id}:gen')
+
+    def __len__(self):
+        return self.client.dbsize()
+
+
+class StatsCache:
+    """Per-business cache for the dashboard statistics functions
+
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalBackend()
+        self.enabled = True
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        ttl = app.config.get('STATS_CACHE_TTL', 30)
+        url = app.config.get('STATS_CACHE_URL')
+
+        self.enabled = ttl > 0
+        if url == 'local':
+            self.backend = SharedBackend(DictClient(), ttl=ttl)
+        elif url:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("STATS_CACHE_URL is set but the redis package is not installed") from e
+            self.backend = SharedBackend(redis.Redis.from_url(url), ttl=ttl)
+        else:
+            self.backend = LocalBackend(app.config.get('STATS_CACHE_SIZE', 1024), ttl)
+
+    def _count(self, name, outcome):
+        with self._lock:
+            counters = self._counters.setdefault(name, {'hits': 0, 'misses': 0})
+            counters[outcome] += 1
+
+    def cached(self, func):
+        """Cache func(business_id) per business until it expires or is invalidated"""
+        name = func.__name__
+
+        @wraps(func)
+        def wrapper(business_id):
+            if not self.enabled:
+                return func(business_id)
+
+            # Read before computing, so an invalidation that lands meanwhile
+            # keeps the (possibly stale) result out of the cache
+            generation = self.backend.generation(business_id)
+            found, value = self.backend.get(business_id, name, generation)
+            if found:
+                self._count(name, 'hits')
+                return value
+
+            self._count(name, 'misses')
+            value = func(business_id)
+            self.backend.set(business_id, name, value, generation)
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+
+    def invalidate(self, business_id):
+        self.backend.invalidate(business_id)
+
+    def stats(self):
+        with self._lock:
+            by_function = {name: dict(counters) for name, counters in self._counters.items()}
+        return {
+            'hits': sum(counters['hits'] for counters in by_function.values()),
+            'misses': sum(counters['misses'] for counters in by_function.values()),
+            'entries': len(self.backend),
+            'functions': by_function
+        }
+
+
+stats_cache = StatsCache()
+
+
+def mark_dirty(session, business_ids):
+    """Invalidate the businesses' cached stats once the session's transaction commits"""
+    session.info.setdefault('stats_cache_dirty', set()).update(business_ids)
+
+
+def dirty_businesses(session):
+    """The businesses marked dirty in the session's current transaction"""
+    return set(session.info.get('stats_cache_dirty', ()))
+
+
+def _mark_dirty(target, business_ids):
+    session = object_session(target)
+    if session is not None:
+        mark_dirty(session, business_ids)
+
+
+def register_listeners():
+    """Invalidate cached stats when interactions, bookings or customers change"""
+    from models import ArchivedInteraction, Interaction, Booking, Customer
+
+    def business_changed(mapper, connection, target):
+        # A row moved to another business changes the stats of both
+        previous = inspect(target).attrs.business_id.history.deleted
+        _mark_dirty(target, {target.business_id, *previous} - {None})
+
+    def customer_changed(mapper, connection, target):
+        # Customers aren't owned by a business; find everyone they've dealt with
+        business_ids = connection.execute(union(
+            select(Interaction.business_id).where(Interaction.customer_id == target.id),
+            select(ArchivedInteraction.business_id).where(ArchivedInteraction.customer_id == target.id),
+            select(Booking.business_id).where(Booking.customer_id == target.id)
+        )).scalars()
+        _mark_dirty(target, set(business_ids))
+
+    for model in (Interaction, Booking):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, business_changed)
+    for name in ('after_update', 'after_delete'):
+        event.listen(Customer, name, customer_changed)
+
+    @event.listens_for(Session, 'after_commit')
+    def invalidate_dirty(session):
+        for business_id in session.info.pop('stats_cache_dirty', ()):
+            stats_cache.invalidate(business_id)
+
+    @event.listens_for(Session, 'after_rollback')
+    def discard_dirty(session):
+        session.info.pop('stats_cache_dirty', None)
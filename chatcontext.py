@@ -0,0 +1,218 @@
+"""Prompt assembly for AI replies on long conversations.
+
+A prompt is the system prompt, a rolling summary of older messages (kept in
+SummaryCheckpoint, apart from the interaction's own summary) and the most
+recent messages verbatim. Whenever `summarize_every` messages have fallen
+out of the recent window they are folded into the summary with one model
+call, so the summary is extended incrementally instead of being rebuilt
+from the whole history.
+
+Folding runs on a background thread (CHAT_SUMMARY_WORKERS) in its own app
+context and database session, after the prompt has been returned, so it
+never delays a reply; the turn that triggers it uses the previous summary.
+
+Prepared state is kept in a per-process LRU keyed by interaction, so a turn
+only reads the messages written since the previous turn. A read never goes
+back further than the recent window plus one fold (recent_messages +
+summarize_every messages); anything older that was never folded, e.g. on a
+cold start of a long conversation without a checkpoint, is treated as
+already summarised. Messages still waiting in the write-behind buffer are
+not visible until it flushes.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import Message, SummaryCheckpoint
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "Update the running summary of a conversation between a customer and a business's assistant. "
+    "Keep names, requests, dates, prices and anything that was promised. Reply with the summary only."
+)
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def _role(sender_type):
+    return 'user' if sender_type == 'customer' else 'assistant'
+
+
+class _ConversationState:
+    def __init__(self, summary, through_id, recent):
+        self.summary = summary
+        self.through_id = through_id
+        self.recent = recent
+        self.last_id = recent[-1]['id'] if recent else through_id
+        self.lock = threading.Lock()
+
+
+class ContextBuilder:
+    def __init__(self, model, recent_messages=20, summarize_every=20, token_budget=3000, cache_size=256, workers=1):
+        self.model = model
+        self.recent_messages = recent_messages
+        self.summarize_every = summarize_every
+        self.token_budget = token_budget
+        self.cache_size = cache_size
+        self.workers = workers
+        self._states = OrderedDict()
+        self._folding = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def _load(self, interaction_id):
+        """Read the stored summary and every message not yet folded into it"""
+        checkpoint = db.session.execute(
+            select(SummaryCheckpoint.summary, SummaryCheckpoint.through_message_id)
+            .where(SummaryCheckpoint.interaction_id == interaction_id)
+        ).first()
+        summary, through_id = checkpoint if checkpoint else (None, None)
+        return _ConversationState(summary, through_id, self._messages_after(interaction_id, through_id))
+
+    def _window(self):
+        return self.recent_messages + self.summarize_every
+
+    def _messages_after(self, interaction_id, message_id):
+        """The newest messages after message_id, oldest first, at most a window's worth"""
+        query = select(Message.id, Message.sender_type, Message.content).where(Message.interaction_id == interaction_id)
+        if message_id is not None:
+            query = query.where(Message.id > message_id)
+        rows = db.session.execute(query.order_by(Message.id.desc()).limit(self._window())).all()
+        return [{'id': row.id, 'role': _role(row.sender_type), 'content': row.content} for row in reversed(rows)]
+
+    def _state(self, interaction_id):
+        with self._lock:
+            state = self._states.get(interaction_id)
+            if state is not None:
+                self._states.move_to_end(interaction_id)
+                return state
+
+        state = self._load(interaction_id)
+        with self._lock:
+            state = self._states.setdefault(interaction_id, state)
+            self._states.move_to_end(interaction_id)
+            while len(self._states) > self.cache_size:
+                self._states.popitem(last=False)
+        return state
+
+    def invalidate(self, interaction_id):
+        with self._lock:
+            self._states.pop(interaction_id, None)
+
+    def _fold_due(self, state):
+        return len(state.recent) >= self.recent_messages + self.summarize_every
+
+    def _fold_later(self, interaction_id):
+        """Extend the conversation's summary in the background, one fold per conversation at a time"""
+        with self._lock:
+            if interaction_id in self._folding:
+                return
+            self._folding.add(interaction_id)
+            if self.workers and (self._executor is None or self._executor_pid != os.getpid()):
+                # Threads don't survive gunicorn's fork, so create the pool lazily in each worker
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='chat-summary')
+                self._executor_pid = os.getpid()
+        app = current_app._get_current_object()
+        if self.workers:
+            self._executor.submit(self._fold, app, interaction_id)
+        else:
+            self._fold(app, interaction_id)
+
+    def _fold(self, app, interaction_id):
+        """Summarise messages that fell out of the recent window, summarize_every at a time"""
+        try:
+            # A fresh app context has its own session, so nothing here touches the request's
+            with app.app_context():
+                state = self._state(interaction_id)
+                while True:
+                    with state.lock:
+                        if not self._fold_due(state):
+                            return
+                        batch = state.recent[:self.summarize_every]
+                        previous_summary, previous_id = state.summary, state.through_id
+                    transcript = '\n'.join(f"{m['role']}: {m['content']}" for m in batch)
+                    summary = self.model.complete([
+                        {'role': 'system', 'content': SUMMARY_INSTRUCTIONS},
+                        {'role': 'user', 'content': f"Summary so far: {previous_summary or '(none)'}\n\nNew messages:\n{transcript}"},
+                    ])
+
+                    if not self._save_summary(interaction_id, previous_id, batch[-1]['id'], summary):
+                        # Another worker advanced the summary first; reload its version next turn
+                        self.invalidate(interaction_id)
+                        return
+                    with state.lock:
+                        state.summary = summary
+                        state.through_id = batch[-1]['id']
+                        state.recent = state.recent[len(batch):]
+        except Exception:
+            # A failed summary only costs prompt space; retry on a later turn
+            logger.exception(f"Could not update the summary of interaction {interaction_id}")
+        finally:
+            with self._lock:
+                self._folding.discard(interaction_id)
+
+    def _save_summary(self, interaction_id, previous_id, through_id, summary):
+        """Store the new summary unless the checkpoint moved since it was read"""
+        try:
+            if previous_id is None:
+                db.session.add(SummaryCheckpoint(interaction_id=interaction_id, through_message_id=through_id, summary=summary))
+                db.session.flush()
+            else:
+                result = db.session.execute(
+                    update(SummaryCheckpoint).where(
+                        SummaryCheckpoint.interaction_id == interaction_id,
+                        SummaryCheckpoint.through_message_id == previous_id
+                    ).values(through_message_id=through_id, summary=summary)
+                )
+                if result.rowcount == 0:
+                    db.session.rollback()
+                    return False
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    def _fit(self, system_prompt, summary, recent, new_message):
+        """Drop the oldest recent messages, then trim the summary, until the prompt fits the budget"""
+        budget = self.token_budget - estimate_tokens(system_prompt) - estimate_tokens(new_message)
+        kept = []
+        used = 0
+        for message in reversed(recent[-self.recent_messages:]):
+            cost = estimate_tokens(message['content'])
+            if used + cost > budget:
+                break
+            kept.append({'role': message['role'], 'content': message['content']})
+            used += cost
+        kept.reverse()
+
+        prompt = [{'role': 'system', 'content': system_prompt}]
+        if summary and budget - used > 0:
+            summary = summary[-(budget - used) * 4:]
+            prompt.append({'role': 'system', 'content': f"Summary of the earlier conversation: {summary}"})
+        return prompt + kept + [{'role': 'user', 'content': new_message}]
+
+    def build(self, interaction_id, system_prompt, new_message):
+        """Return the chat messages to send to the model for the next reply"""
+        state = self._state(interaction_id)
+        with state.lock:
+            new = self._messages_after(interaction_id, state.last_id)
+            if new:
+                state.recent.extend(new)
+                del state.recent[:-self._window()]
+                state.last_id = new[-1]['id']
+            prompt = self._fit(system_prompt, state.summary, state.recent, new_message)
+            fold_due = self._fold_due(state)
+        if fold_due:
+            self._fold_later(interaction_id)
+        return prompt
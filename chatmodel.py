@@ -0,0 +1,61 @@
+import os
+import time
+
+
+class ChatModelNotConfigured(Exception):
+    """No usable chat model backend is configured"""
+
+
+class OpenAIChatModel:
+    """Streams replies from the OpenAI chat completions API"""
+
+    def __init__(self, model='gpt-4o-mini', api_key=None):
+        from openai import OpenAI
+
+        self.model = model
+        self.client = OpenAI(api_key=api_key)
+
+    def stream_reply(self, messages):
+        stream = self.client.chat.completions.create(model=self.model, messages=messages, stream=True)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def complete(self, messages):
+        response = self.client.chat.completions.create(model=self.model, messages=messages)
+        return response.choices[0].message.content or ''
+
+
+class FakeChatModel:
+    """Local stand-in that streams a canned reply word by word, for tests and offline runs"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def stream_reply(self, messages):
+        last = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        reply = f"Thanks for your message! You said: {last}"
+        for i, word in enumerate(reply.split(' ')):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word if i == 0 else ' ' + word
+
+    def complete(self, messages):
+        return ' '.join(m['content'] for m in messages if m['role'] == 'user')[-500:]
+
+
+def create_chat_model(config):
+    """Build the model client selected by CHAT_MODEL_BACKEND ('openai' or 'fake')
+
+    The canned fake model is only used when asked for by name, never as a
+    fallback for a missing API key.
+    """
+    backend = config.get('CHAT_MODEL_BACKEND') or 'openai'
+
+    if backend == 'openai':
+        if not os.environ.get('OPENAI_API_KEY'):
+            raise ChatModelNotConfigured("Set OPENAI_API_KEY, or CHAT_MODEL_BACKEND=fake for local runs")
+        return OpenAIChatModel(config.get('CHAT_MODEL', 'gpt-4o-mini'))
+    if backend == 'fake':
+        return FakeChatModel(config.get('FAKE_CHAT_DELAY', 0.0))
+    raise ValueError(f"Unknown CHAT_MODEL_BACKEND: {backend}")
@@ -0,0 +1,256 @@
+import click
+from datetime import datetime, timedelta
+from sqlalchemy import inspect
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db
+from models import Business, Interaction
+from querycount import QueryCounter
+from search import create_search_index
+from partitions import create_partitions, drop_empty_partitions
+
+# Plan lines that mean a table is read in full rather than through an index
+SEQ_SCAN_MARKERS = {
+    'postgresql': 'Seq Scan on ',
+    'sqlite': 'SCAN ',
+}
+
+
+def _capture_selects(callback):
+    """Run callback and return every SELECT statement it sent to the database"""
+    with QueryCounter(db.engine) as counter:
+        callback()
+    return [
+        (statement, parameters) for statement, parameters in counter.statements
+        if statement.lstrip().upper().startswith('SELECT')
+    ]
+
+
+def _login_client(business_id):
+    """A test client already logged in as the given business"""
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(business_id)
+        session['_fresh'] = True
+    return client
+
+
+def _get(client, url):
+    """GET url and return its status code (None if it raised) and the exception, if any"""
+    try:
+        return client.get(url).status_code, None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+def _default_business_id(business_id):
+    if business_id is not None:
+        return business_id
+    business = Business.query.order_by(Business.id).first()
+    if business is None:
+        raise click.ClickException('No businesses found; seed the database first.')
+    return business.id
+
+
+def _run_dashboard_queries(business_id):
+    """Issue the queries made by utils.py and the GET routes in routes.py
+
+    Returns (url, status, error) for each route that answered 400 or more or
+    raised; their queries may not all have run.
+    """
+    from utils import get_interaction_stats, get_booking_stats, get_customer_stats
+
+    # Bypass the stats cache so the queries actually run
+    get_interaction_stats.uncached(business_id)
+    get_booking_stats.uncached(business_id)
+    get_customer_stats.uncached(business_id)
+
+    client = _login_client(business_id)
+    urls = [
+        rule.rule for rule in current_app.url_map.iter_rules()
+        if 'GET' in rule.methods and not rule.arguments and rule.endpoint not in ('static', 'main.logout')
+    ]
+    interaction = Interaction.query.filter_by(business_id=business_id).first()
+    if interaction:
+        urls.append(f'/dashboard/interaction/{interaction.id}')
+
+    failures = []
+    for url in urls:
+        status, error = _get(client, url)
+        if status is None or status >= 400:
+            failures.append((url, status, error))
+    return failures
+
+
+def _explain(statement, parameters):
+    """Return the query plan lines for a captured statement"""
+    dialect = db.engine.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    # SQLite returns (id, parent, notused, detail); PostgreSQL a single text column
+    return [row[-1] for row in rows]
+
+
+def _sequential_scans(plan, table_names):
+    """Return plan lines that scan one of the application's tables in full"""
+    marker = SEQ_SCAN_MARKERS.get(db.engine.dialect.name)
+    if marker is None:
+        return []
+
+    scans = []
+    for line in plan:
+        detail = line.strip().lstrip('->').strip()
+        if not detail.startswith(marker) or 'USING' in detail:
+            continue
+        scanned = detail[len(marker):].split()[0].strip('"')
+        if scanned in table_names:
+            scans.append(detail)
+    return scans
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create any missing tables, indexes of new tables and the SQLite search index."""
+    click.echo("Creating database tables...")
+    db.create_all()
+    click.echo("Database tables created successfully.")
+
+
+@click.command('create-indexes')
+@with_appcontext
+def create_indexes():
+    """Create any declared indexes missing from existing tables."""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                # create() skips indexes declared with ddl_if for another database
+                index.create(db.engine)
+        created = {index['name'] for index in inspect(db.engine).get_indexes(table.name)} - existing
+        for name in sorted(created):
+            click.echo(f"Created {name} on {table.name}")
+    # SQLite has no GIN indexes; search uses FTS5 tables instead
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+
+
+@click.command('backfill-rollups')
+@with_appcontext
+@click.option('--batch-size', default=100, show_default=True, help='Businesses rebuilt per transaction.')
+def backfill_rollups_command(batch_size):
+    """Rebuild the daily interaction and booking rollups from the raw tables."""
+    from rollups import backfill_rollups
+
+    done = 0
+    for done in backfill_rollups(batch_size):
+        click.echo(f"Rebuilt rollups for {done} businesses")
+    click.echo(f"Done: {done} businesses. Set STATS_USE_ROLLUPS=1 to read statistics from the rollups.")
+
+
+@click.command('create-partitions')
+@with_appcontext
+@click.option('--months-ahead', type=int, help='Months of partitions to keep ready (default MESSAGE_PARTITIONS_AHEAD).')
+def create_partitions_command(months_ahead):
+    """Create the upcoming monthly message partitions on PostgreSQL; run it monthly."""
+    if months_ahead is None:
+        months_ahead = current_app.config['MESSAGE_PARTITIONS_AHEAD']
+    with db.engine.begin() as connection:
+        created = create_partitions(connection, months_ahead)
+    for name in created:
+        click.echo(f"Created partition {name}")
+    click.echo(f"Done: {len(created)} partitions created.")
+
+
+@click.command('archive-interactions')
+@with_appcontext
+@click.option('--older-than-days', type=int, help='Archive months ending this many days ago (default ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', default=500, show_default=True, help='Interactions archived per transaction.')
+def archive_interactions_command(older_than_days, batch_size):
+    """Move old interactions and their messages into compressed monthly archive files."""
+    from archive import ArchiveNotConfigured, archive_dir, archive_interactions
+
+    try:
+        archive_dir()
+    except ArchiveNotConfigured as e:
+        raise click.ClickException(str(e))
+    if older_than_days is None:
+        older_than_days = current_app.config['ARCHIVE_AFTER_DAYS']
+    # Archive whole months, so the partitions they were stored in end up empty
+    horizon = datetime.utcnow() - timedelta(days=older_than_days)
+    cutoff = datetime(horizon.year, horizon.month, 1)
+
+    done = 0
+    for done in archive_interactions(cutoff, batch_size):
+        click.echo(f"Archived {done} interactions")
+    with db.engine.begin() as connection:
+        for name in drop_empty_partitions(connection, cutoff):
+            click.echo(f"Dropped empty partition {name}")
+    click.echo(f"Done: {done} interactions that started before {cutoff:%Y-%m-%d} archived.")
+
+
+@click.command('seed-data')
+@with_appcontext
+@click.option('--businesses', default=1, show_default=True, help='Tenants to create.')
+@click.option('--customers', default=100, show_default=True, help='Customers per tenant.')
+@click.option('--interactions', default=1000, show_default=True, help='Interactions per tenant.')
+@click.option('--messages', default=4, show_default=True, help='Messages per interaction.')
+@click.option('--bookings', default=200, show_default=True, help='Bookings per tenant.')
+@click.option('--days', default=90, show_default=True, help='Days of history to spread rows over.')
+@click.option('--seed', default=0, show_default=True, help='Random seed, for reproducible datasets.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per bulk insert.')
+def seed_data(**options):
+    """Seed synthetic tenants for benchmarks and query-plan checks."""
+    from datagen import generate
+
+    for business, table, rows in generate(**options):
+        click.echo(f"Business {business}/{options['businesses']}: {rows} {table} rows")
+
+
+@click.command('explain-queries')
+@with_appcontext
+@click.option('--business-id', type=int, help='Business to run the queries for (defaults to the first one).')
+def explain_queries(business_id):
+    """EXPLAIN the dashboard queries and report sequential scans."""
+    business_id = _default_business_id(business_id)
+    failures = []
+    statements = _capture_selects(lambda: failures.extend(_run_dashboard_queries(business_id)))
+    table_names = set(db.metadata.tables)
+
+    seen = set()
+    flagged = 0
+    for statement, parameters in statements:
+        if statement in seen:
+            continue
+        seen.add(statement)
+
+        scans = _sequential_scans(_explain(statement, parameters), table_names)
+        if scans:
+            flagged += 1
+            click.echo(' '.join(statement.split()))
+            for scan in scans:
+                click.echo(f"    {scan}")
+            click.echo()
+
+    # 4xx answers come from routes needing input this command doesn't send
+    # (an API key, search terms); errors mean the route itself is broken
+    broken = 0
+    for url, status, error in failures:
+        if status is None or status >= 500:
+            broken += 1
+            click.echo(f"GET {url} failed ({error or f'status {status}'}); its queries were not all checked")
+        else:
+            click.echo(f"GET {url} skipped (status {status})")
+    click.echo(f"{len(seen)} distinct queries checked, {flagged} with sequential scans, {broken} routes failed.")
+    if flagged or broken:
+        raise SystemExit(1)
+
+
+def init_app(app):
+    for command in (init_db, create_indexes, create_partitions_command, backfill_rollups_command,
+                    archive_interactions_command, seed_data, explain_queries):
+        app.cli.add_command(command)
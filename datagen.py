@@ -0,0 +1,112 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from app import db
+from models import Business, Customer, Interaction, Message, Booking
+from availability import bookings_changed
+from rollups import rebuild_rollups
+
+INTERACTION_TYPES = ['chat', 'call', 'message']
+BOOKING_STATUSES = ['scheduled', 'completed', 'cancelled']
+SENDER_TYPES = ['customer', 'bot', 'business']
+SERVICES = ['Consultation', 'Check-up', 'Follow-up', 'Haircut', 'Table for two', 'Demo']
+
+
+def _insert_returning_ids(model, rows):
+    """Bulk insert rows and return their new primary keys in the same order"""
+    result = db.session.execute(
+        insert(model).returning(model.id, sort_by_parameter_order=True), rows
+    )
+    return result.scalars().all()
+
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield min(batch_size, total - start)
+
+
+def generate(businesses=1, customers=100, interactions=1000, messages=4, bookings=200,
+             days=90, seed=0, batch_size=5000):
+    """Seed synthetic tenants; counts other than businesses are per business
+
+    Rows are written with bulk inserts and committed per batch, so scale is
+    limited by the database rather than by Python memory. Yields
+    (business number, table, rows written so far) progress tuples.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    # Python-side bcrypt/scrypt is slow; every synthetic tenant shares one hash
+    template = Business(business_name='template')
+    template.set_password('password123')
+
+    first_id = (db.session.query(func.max(Business.id)).scalar() or 0) + 1
+    for n in range(businesses):
+        number = first_id + n
+        [business_id] = _insert_returning_ids(Business, [{
+            'business_name': f'Benchmark Business {number}',
+            'email': f'bench{number}@example.com',
+            'password_hash': template.password_hash,
+            'business_type': rng.choice(['clinic', 'retail', 'salon', 'restaurant', 'office']),
+            'created_at': now - timedelta(days=days),
+        }])
+
+        customer_ids = _insert_returning_ids(Customer, [{
+            'name': f'Customer {number}-{i}',
+            'email': f'customer{number}-{i}@example.com',
+            'phone': f'+1555{rng.randrange(10 ** 7):07d}',
+            'is_new': rng.random() < 0.3,
+            'created_at': now - timedelta(days=rng.uniform(0, days)),
+        } for i in range(customers)])
+        db.session.commit()
+        yield n + 1, 'customer', customers
+
+        written = 0
+        for size in _batches(interactions, batch_size):
+            rows = []
+            for _ in range(size):
+                start = now - timedelta(seconds=rng.uniform(0, days * 86400))
+                duration = rng.randint(30, 1800)
+                rows.append({
+                    'business_id': business_id,
+                    'customer_id': rng.choice(customer_ids),
+                    'interaction_type': rng.choice(INTERACTION_TYPES),
+                    'start_time': start,
+                    'end_time': start + timedelta(seconds=duration),
+                    'duration': duration,
+                    'summary': f'Synthetic conversation {rng.randrange(10 ** 6)}',
+                    'created_at': start,
+                })
+            interaction_ids = _insert_returning_ids(Interaction, rows)
+
+            message_rows = [{
+                'interaction_id': interaction_id,
+                'sender_type': SENDER_TYPES[i % 2] if rng.random() < 0.9 else 'business',
+                'content': f'Synthetic message {i} of conversation {interaction_id}',
+                'timestamp': row['start_time'] + timedelta(seconds=i * row['duration'] // max(messages, 1)),
+            } for interaction_id, row in zip(interaction_ids, rows) for i in range(messages)]
+            if message_rows:
+                db.session.execute(insert(Message), message_rows)
+
+            db.session.commit()
+            written += size
+            yield n + 1, 'interaction', written
+
+        written = 0
+        for size in _batches(bookings, batch_size):
+            db.session.execute(insert(Booking), [{
+                'business_id': business_id,
+                'customer_id': rng.choice(customer_ids),
+                'service': rng.choice(SERVICES),
+                'booking_time': now + timedelta(minutes=15 * rng.randint(-days * 96, 30 * 96)),
+                'duration': rng.choice([15, 30, 45, 60]),
+                'status': rng.choice(BOOKING_STATUSES),
+                'created_at': now - timedelta(days=rng.uniform(0, days)),
+            } for _ in range(size)])
+            db.session.commit()
+            written += size
+            yield n + 1, 'booking', written
+
+        # Bulk inserts bypass the ORM events that maintain the rollups and availability indexes
+        rebuild_rollups([business_id])
+        bookings_changed(db.session, [business_id])
+        db.session.commit()
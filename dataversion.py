@@ -0,0 +1,66 @@
+"""Per-business data version, used to answer unchanged dashboard refreshes with 304.
+
+Every commit that changes a business's interactions, bookings or customers
+stamps BusinessDataVersion.updated_at inside the same transaction, so the
+stamp moves exactly when the data does. Changes that invalidate the stats
+cache (cache.mark_dirty) are picked up automatically; Core writes that only
+change what the dashboard lists, such as message end times, call touch().
+"""
+from datetime import datetime
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from app import db
+from cache import dirty_businesses
+from models import BusinessDataVersion
+from rollups import UPSERT_DIALECTS
+
+
+def touch(session, business_ids):
+    """Stamp the businesses' data version when the session's transaction commits"""
+    session.info.setdefault('data_version_dirty', set()).update(business_ids)
+
+
+def _stamp(connection, business_ids, now):
+    rows = [{'business_id': business_id, 'updated_at': now} for business_id in sorted(business_ids)]
+
+    dialect_insert = UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(BusinessDataVersion).values(rows)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['business_id'],
+            set_={'updated_at': stmt.excluded.updated_at}
+        ))
+        return
+
+    connection.execute(
+        update(BusinessDataVersion).where(BusinessDataVersion.business_id.in_(business_ids)).values(updated_at=now)
+    )
+    existing = set(connection.execute(
+        select(BusinessDataVersion.business_id).where(BusinessDataVersion.business_id.in_(business_ids))
+    ).scalars())
+    missing = [row for row in rows if row['business_id'] not in existing]
+    if missing:
+        connection.execute(insert(BusinessDataVersion), missing)
+
+
+def register_listeners():
+    """Stamp the data version of every business a commit changed"""
+    @event.listens_for(Session, 'before_commit')
+    def stamp_versions(session):
+        # The ORM listeners mark businesses dirty while flushing, so flush first
+        session.flush()
+        business_ids = dirty_businesses(session) | session.info.get('data_version_dirty', set())
+        if business_ids:
+            _stamp(session.connection(), business_ids, datetime.utcnow())
+
+    @event.listens_for(Session, 'after_commit')
+    @event.listens_for(Session, 'after_rollback')
+    def discard_touched(session):
+        session.info.pop('data_version_dirty', None)
+
+
+def data_version(business_id):
+    """When the business's data last changed, or None if it hasn't since versions were recorded"""
+    return db.session.execute(
+        select(BusinessDataVersion.updated_at).where(BusinessDataVersion.business_id == business_id)
+    ).scalar()
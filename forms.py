@@ -51,4 +51,10 @@ class PasswordChangeForm(FlaskForm):
 
 class ChatbotForm(FlaskForm):
     message = TextAreaField('Message', validators=[DataRequired()])
-    submit = SubmitField('Send')
\ No newline at end of file
+    submit = SubmitField('Send')
+
+class ApiKeyForm(FlaskForm):
+    submit = SubmitField('Generate API Key')
+
+class RevokeApiKeyForm(FlaskForm):
+    submit = SubmitField('Revoke')
@@ -0,0 +1,11 @@
+"""Gunicorn settings, picked up automatically by `gunicorn main:app`.
+
+Threaded workers serve several requests at once, so one slow aggregate (e.g.
+a chart endpoint on a large tenant) no longer blocks every other request on
+its worker. The database pool must allow GUNICORN_THREADS plus STATS_WORKERS
+connections per worker.
+"""
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
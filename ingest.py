@@ -0,0 +1,243 @@
+from datetime import datetime, timezone
+from sqlalchemy import func, insert, or_, select, union, update
+from app import db
+from cache import mark_dirty
+from models import ArchivedInteraction, Customer, Interaction, Message, Booking
+from rollups import record_bulk_insert
+
+MAX_BATCH_INTERACTIONS = 500
+MAX_BATCH_MESSAGES = 10000
+INTERACTION_TYPES = {'chat', 'call', 'message'}
+SENDER_TYPES = {'bot', 'customer', 'business'}
+
+
+class IngestError(ValueError):
+    """The submitted batch is malformed; nothing from it was written"""
+
+
+def _parse_time(value, field, default=None):
+    """Parse an ISO 8601 timestamp into the naive UTC datetimes stored by the models"""
+    if value is None:
+        return default
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"{field} must be an ISO 8601 timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _string(item, field, path, max_length=None, required=False):
+    value = item.get(field)
+    if value is None or value == '':
+        if required:
+            raise IngestError(f"{path}.{field} is required")
+        return None
+    if not isinstance(value, str):
+        raise IngestError(f"{path}.{field} must be a string")
+    if max_length and len(value) > max_length:
+        raise IngestError(f"{path}.{field} must be at most {max_length} characters")
+    return value
+
+
+def _customer_key(customer):
+    """Identity used to upsert a customer: their email, or failing that their phone"""
+    if customer['email']:
+        return 'email', customer['email'].lower()
+    if customer['phone']:
+        return 'phone', customer['phone']
+    return None
+
+
+def _validate(payload):
+    """Check the whole batch up front so a bad item rejects it before anything is written"""
+    if not isinstance(payload, dict) or not isinstance(payload.get('interactions'), list):
+        raise IngestError("Body must be a JSON object with an 'interactions' list")
+
+    items = payload['interactions']
+    if not items:
+        raise IngestError("'interactions' is empty")
+    if len(items) > MAX_BATCH_INTERACTIONS:
+        raise IngestError(f"At most {MAX_BATCH_INTERACTIONS} interactions per batch")
+
+    now = datetime.utcnow()
+    interactions = []
+    message_count = 0
+    for i, item in enumerate(items):
+        path = f'interactions[{i}]'
+        if not isinstance(item, dict):
+            raise IngestError(f"{path} must be an object")
+
+        interaction_type = item.get('type')
+        if interaction_type not in INTERACTION_TYPES:
+            raise IngestError(f"{path}.type must be one of {', '.join(sorted(INTERACTION_TYPES))}")
+
+        customer = item.get('customer')
+        if not isinstance(customer, dict):
+            raise IngestError(f"{path}.customer must be an object")
+        customer = {
+            'name': _string(customer, 'name', f'{path}.customer', 100, required=True),
+            'email': _string(customer, 'email', f'{path}.customer', 120),
+            'phone': _string(customer, 'phone', f'{path}.customer', 20),
+        }
+
+        start_time = _parse_time(item.get('start_time'), f'{path}.start_time', now)
+        end_time = _parse_time(item.get('end_time'), f'{path}.end_time')
+        if end_time and end_time < start_time:
+            raise IngestError(f"{path}.end_time must not be before start_time")
+        duration = item.get('duration')
+        if duration is not None and (isinstance(duration, bool) or not isinstance(duration, int) or duration < 0):
+            raise IngestError(f"{path}.duration must be a non-negative integer number of seconds")
+        if duration is None and end_time:
+            duration = int((end_time - start_time).total_seconds())
+
+        messages = item.get('messages', [])
+        if not isinstance(messages, list):
+            raise IngestError(f"{path}.messages must be a list")
+        message_rows = []
+        for j, message in enumerate(messages):
+            message_path = f'{path}.messages[{j}]'
+            if not isinstance(message, dict):
+                raise IngestError(f"{message_path} must be an object")
+            if message.get('sender_type') not in SENDER_TYPES:
+                raise IngestError(f"{message_path}.sender_type must be one of {', '.join(sorted(SENDER_TYPES))}")
+            message_rows.append({
+                'sender_type': message['sender_type'],
+                'content': _string(message, 'content', message_path, required=True),
+                'timestamp': _parse_time(message.get('timestamp'), f'{message_path}.timestamp', start_time),
+            })
+        message_count += len(message_rows)
+
+        interactions.append({
+            'customer': customer,
+            'row': {
+                'interaction_type': interaction_type,
+                'start_time': start_time,
+                'end_time': end_time,
+                'duration': duration,
+                'summary': _string(item, 'summary', path),
+                'created_at': now,
+            },
+            'messages': message_rows,
+        })
+
+    if message_count > MAX_BATCH_MESSAGES:
+        raise IngestError(f"At most {MAX_BATCH_MESSAGES} messages per batch")
+    return interactions
+
+
+def customers_of(business_id):
+    """Ids of the customers who have dealt with the business"""
+    return union(
+        select(Interaction.customer_id).where(Interaction.business_id == business_id),
+        select(ArchivedInteraction.customer_id).where(ArchivedInteraction.business_id == business_id),
+        select(Booking.customer_id).where(Booking.business_id == business_id),
+    )
+
+
+def _upsert_customers(business_id, customers):
+    """Return a customer id for each submitted customer, creating the ones not seen before
+
+    Customers of this business matched by email or phone are marked as
+    returning; those of other businesses are never matched.
+    """
+    keys = [_customer_key(customer) for customer in customers]
+    emails = {value for kind, value in filter(None, keys) if kind == 'email'}
+    phones = {value for kind, value in filter(None, keys) if kind == 'phone'}
+
+    known = {}
+    if emails or phones:
+        rows = db.session.execute(
+            select(Customer.id, Customer.email, Customer.phone).where(
+                or_(func.lower(Customer.email).in_(emails), Customer.phone.in_(phones)),
+                Customer.id.in_(customers_of(business_id))
+            ).order_by(Customer.id)
+        )
+        for customer_id, email, phone in rows:
+            if email:
+                known.setdefault(('email', email.lower()), customer_id)
+            if phone:
+                known.setdefault(('phone', phone), customer_id)
+
+    # Create each unknown customer once, even if it appears several times in the batch
+    ids = [None] * len(customers)
+    new_rows = []
+    new_row_of_key = {}
+    new_row_of_item = {}
+    for i, (key, customer) in enumerate(zip(keys, customers)):
+        if key in known:
+            ids[i] = known[key]
+        elif key in new_row_of_key:
+            new_row_of_item[i] = new_row_of_key[key]
+        else:
+            new_row_of_item[i] = len(new_rows)
+            if key is not None:
+                new_row_of_key[key] = len(new_rows)
+            new_rows.append({**customer, 'is_new': True, 'created_at': datetime.utcnow()})
+
+    if new_rows:
+        new_ids = db.session.execute(
+            insert(Customer).returning(Customer.id, sort_by_parameter_order=True), new_rows
+        ).scalars().all()
+        for i, row in new_row_of_item.items():
+            ids[i] = new_ids[row]
+
+    returning = {known[key] for key in keys if key in known}
+    if returning:
+        db.session.execute(
+            update(Customer).where(Customer.id.in_(returning), Customer.is_new == True).values(is_new=False)
+        )
+
+    return ids, len(new_rows), returning
+
+
+def ingest_batch(business_id, payload):
+    """Write a batch of interactions with their messages and customers in one transaction
+
+    Every table is written with a single multi-row INSERT (RETURNING the new
+    ids where later rows need them) instead of per-row ORM adds.
+    """
+    interactions = _validate(payload)
+
+    try:
+        customer_ids, customers_created, returning = _upsert_customers(
+            business_id, [item['customer'] for item in interactions]
+        )
+
+        rows = [
+            {**item['row'], 'business_id': business_id, 'customer_id': customer_id}
+            for item, customer_id in zip(interactions, customer_ids)
+        ]
+        interaction_ids = db.session.execute(
+            insert(Interaction).returning(Interaction.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+
+        message_rows = [
+            {**message, 'interaction_id': interaction_id}
+            for item, interaction_id in zip(interactions, interaction_ids)
+            for message in item['messages']
+        ]
+        if message_rows:
+            db.session.execute(insert(Message), message_rows)
+
+        # Bulk inserts skip the ORM events, so keep the rollups and stats cache in step here
+        record_bulk_insert(db.session.connection(), Interaction, rows)
+        affected = {business_id}
+        if returning:
+            affected.update(db.session.execute(union(
+                select(Interaction.business_id).where(Interaction.customer_id.in_(returning)),
+                select(Booking.business_id).where(Booking.customer_id.in_(returning))
+            )).scalars())
+        mark_dirty(db.session, affected)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'interactions': interaction_ids,
+        'messages': len(message_rows),
+        'customers_created': customers_created,
+    }
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by endpoint (or another label)"""
+
+    def __init__(self, name, description, buckets, label='endpoint'):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        with self._lock:
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for endpoint, series in sorted(self._series.items()):
+                label = f'{self.label}="{endpoint}"'
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{label}}} {series["sum"]}')
+                lines.append(f'{self.name}_count{{{label}}} {series["count"]}')
+        return lines
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Wall time spent handling a request.', DURATION_BUCKETS)
+request_sql_statements = Histogram(
+    'http_request_sql_statements', 'SQL statements executed per request.', STATEMENT_BUCKETS)
+request_sql_duration = Histogram(
+    'http_request_sql_duration_seconds', 'Time spent in SQL per request.', DURATION_BUCKETS)
+pool_checkout_wait = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time to get a pooled database connection, waiting or connecting.', POOL_WAIT_BUCKETS,
+    label='pool')
+
+
+def connection_requested(session):
+    """Note that the session is about to ask for a connection (see RoutingSession.get_bind)"""
+    session.info['connection_requested_at'] = time.perf_counter()
+
+
+def _connection_checked_out(session, transaction, connection):
+    # The pool's own checkout event only fires once the wait is over, so time it
+    # from the session's request for a bind to the connection joining its transaction
+    start = session.info.pop('connection_requested_at', None)
+    if start is not None:
+        pool_checkout_wait.observe(connection.engine.pool.logging_name or 'default', time.perf_counter() - start)
+
+
+_slow_query_seconds = 0
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # Keyed by execution context: a statement that fails never reaches after_cursor_execute
+    conn.info.setdefault('query_start_time', {})[context] = time.perf_counter()
+
+
+def _discard_query_timer(exception_context):
+    if exception_context.connection is not None:
+        exception_context.connection.info.get('query_start_time', {}).pop(exception_context.execution_context, None)
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.get('query_start_time', {}).pop(context, None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+
+    # Counted for requests (see init_app) and for gather_stats workers on their behalf
+    if has_app_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+
+    if _slow_query_seconds and elapsed >= _slow_query_seconds:
+        endpoint = request.endpoint if has_request_context() else None
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms, endpoint={endpoint}): {' '.join(statement.split())}")
+
+
+def register_listeners():
+    """Time every statement"""
+    event.listen(Engine, 'before_cursor_execute', _start_query_timer)
+    event.listen(Engine, 'after_cursor_execute', _stop_query_timer)
+    event.listen(Engine, 'handle_error', _discard_query_timer)
+    event.listen(Session, 'after_begin', _connection_checked_out)
+
+
+def init_app(app):
+    """Record per-request wall time, SQL statement count and SQL time, tagged by endpoint
+
+    Metrics are kept per process; with several gunicorn workers each one
+    reports its own series and Prometheus aggregates them.
+    """
+    if app.extensions.get('metrics'):
+        return
+    app.extensions['metrics'] = True
+
+    global _slow_query_seconds
+    _slow_query_seconds = app.config.get('SLOW_QUERY_MS', 0) / 1000
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start_time = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+
+    @app.teardown_request
+    def record_request(exc):
+        start = g.pop('request_start_time', None)
+        if start is None:
+            return
+        endpoint = request.endpoint or 'unmatched'
+        request_duration.observe(endpoint, time.perf_counter() - start)
+        request_sql_statements.observe(endpoint, g.get('sql_count', 0))
+        request_sql_duration.observe(endpoint, g.get('sql_time', 0.0))
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    from cache import stats_cache
+
+    lines = []
+    for histogram in (request_duration, request_sql_statements, request_sql_duration, pool_checkout_wait):
+        lines += histogram.render()
+
+    cache_stats = stats_cache.stats()
+    for outcome in ('hits', 'misses'):
+        name = f'stats_cache_{outcome}_total'
+        lines += [f'# HELP {name} Dashboard statistics cache {outcome}.', f'# TYPE {name} counter']
+        for function, counters in sorted(cache_stats['functions'].items()):
+            lines.append(f'{name}{{function="{function}"}} {counters[outcome]}')
+    lines += [
+        '# HELP stats_cache_entries Entries held by the dashboard statistics cache.',
+        '# TYPE stats_cache_entries gauge',
+        f'stats_cache_entries {cache_stats["entries"]}',
+    ]
+    return '\n'.join(lines) + '\n'
@@ -1,7 +1,13 @@
+import hashlib
+import secrets
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.dialects import postgresql  # noqa: F401 - types func.to_tsvector for the search indexes
+from passwords import password_hasher
+
+# Text search configuration of the PostgreSQL full-text indexes (see search.py)
+TEXT_SEARCH_CONFIG = db.literal_column("'english'")
 
 class Business(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,14 +24,37 @@ class Business(UserMixin, db.Model):
     bookings = db.relationship('Booking', backref='business', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
     
     def __repr__(self):
         return f'<Business {self.business_name}>'
 
+class ApiKey(db.Model):
+    """Bearer token letting an integration write to a business through the JSON API"""
+    id = db.Column(db.Integer, primary_key=True)
+    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), nullable=False, index=True)
+    key_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    business = db.relationship('Business', backref=db.backref('api_keys', lazy=True))
+    
+    def set_key(self):
+        """Generate a new key, store only its hash and return the key itself"""
+        key = secrets.token_urlsafe(32)
+        self.key_hash = self.hash_key(key)
+        return key
+    
+    @staticmethod
+    def hash_key(key):
+        # Keys are random 256-bit tokens, so a fast unsalted hash is enough
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    def __repr__(self):
+        return f'<ApiKey {self.id} for business {self.business_id}>'
+
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -55,9 +84,53 @@ class Interaction(db.Model):
     # Relationships
     messages = db.relationship('Message', backref='interaction', lazy=True)
     
+    # Dashboard queries filter by business and then by time or type; search
+    # matches summaries through a GIN index (SQLite uses an FTS5 table instead)
+    __table_args__ = (
+        db.Index('ix_interaction_business_start_time', 'business_id', 'start_time'),
+        db.Index('ix_interaction_business_type', 'business_id', 'interaction_type'),
+        db.Index(
+            'ix_interaction_summary_fts', db.func.to_tsvector(TEXT_SEARCH_CONFIG, summary), postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+    )
+    
     def __repr__(self):
         return f'<Interaction {self.id} - {self.interaction_type}>'
 
+class SummaryCheckpoint(db.Model):
+    """Rolling summary of a conversation kept by the chat context builder, and the last message folded into it"""
+    interaction_id = db.Column(db.Integer, db.ForeignKey('interaction.id'), primary_key=True)
+    through_message_id = db.Column(db.Integer, nullable=False)
+    summary = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SummaryCheckpoint {self.interaction_id} through {self.through_message_id}>'
+
+class BusinessDataVersion(db.Model):
+    """When a business's interactions, bookings or customers last changed; versions the dashboard payload"""
+    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), primary_key=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<BusinessDataVersion {self.business_id} at {self.updated_at}>'
+
+class ArchivedInteraction(db.Model):
+    """An interaction moved out of the live tables into a monthly archive file by archive.py"""
+    id = db.Column(db.Integer, primary_key=True)  # the id it had in Interaction
+    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    interaction_type = db.Column(db.String(20), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    archive = db.Column(db.String(7), nullable=False)  # YYYY-MM of the archive file
+    
+    __table_args__ = (
+        db.Index('ix_archived_interaction_business_start_time', 'business_id', 'start_time'),
+    )
+    
+    def __repr__(self):
+        return f'<ArchivedInteraction {self.id} in {self.archive}>'
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     interaction_id = db.Column(db.Integer, db.ForeignKey('interaction.id'), nullable=False)
@@ -65,6 +138,16 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Conversations are always read in timestamp order. On PostgreSQL the
+    # table is partitioned by month of timestamp (see partitions.py)
+    __table_args__ = (
+        db.Index('ix_message_interaction_timestamp', 'interaction_id', 'timestamp'),
+        db.Index(
+            'ix_message_content_fts', db.func.to_tsvector(TEXT_SEARCH_CONFIG, content), postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+        {'postgresql_partition_by': 'RANGE ("timestamp")', 'info': {'partition_key': 'timestamp'}},
+    )
+    
     def __repr__(self):
         return f'<Message {self.id} from {self.sender_type}>'
 
@@ -79,5 +162,38 @@ class Booking(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Listings and stats filter by business, then booking time and status
+    __table_args__ = (
+        db.Index('ix_booking_business_time_status', 'business_id', 'booking_time', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<Booking {self.id} - {self.service}>'
+
+class BookingVersion(db.Model):
+    """Per-business counter bumped by every commit that changes bookings, maintained by availability.py"""
+    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<BookingVersion {self.business_id} v{self.version}>'
+
+class DailyInteractionRollup(db.Model):
+    """Per-business interaction counts per day and type, maintained by rollups.py"""
+    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    interaction_type = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyInteractionRollup {self.business_id} {self.day} {self.interaction_type}={self.count}>'
+
+class DailyBookingRollup(db.Model):
+    """Per-business booking counts per day and status, maintained by rollups.py"""
+    business_id = db.Column(db.Integer, db.ForeignKey('business.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
     def __repr__(self):
-        return f'<Booking {self.id} - {self.service}>'
\ No newline at end of file
+        return f'<DailyBookingRollup {self.business_id} {self.day} {self.status}={self.count}>'
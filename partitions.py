@@ -0,0 +1,125 @@
+"""Monthly range partitions of the message table on PostgreSQL.
+
+Message is declared PARTITION BY RANGE (timestamp) in models.py; SQLite,
+for local runs, keeps it a plain table and everything here is a no-op.
+PostgreSQL requires the partition key in the primary key, so on that
+dialect the key is compiled as (id, timestamp); ids still come from one
+sequence and the ORM keeps addressing messages by id alone.
+
+A DEFAULT partition catches rows outside the monthly ones (e.g. historical
+ingests). create_partitions() adds the months from the oldest such row up
+to `months_ahead` months from now, moving rows out of the default
+partition first; run `flask create-partitions` monthly. Once archival has
+emptied old months, drop_empty_partitions() drops them, which frees their
+storage at once instead of leaving it for vacuum.
+"""
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import PrimaryKeyConstraint, event
+from sqlalchemy.ext.compiler import compiles
+from models import Message
+
+PARTITIONED_TABLE = Message.__table__
+
+
+@compiles(PrimaryKeyConstraint, 'postgresql')
+def _primary_key_with_partition_key(constraint, compiler, **kw):
+    text = compiler.visit_primary_key_constraint(constraint, **kw)
+    partition_key = constraint.table.info.get('partition_key')
+    if partition_key and text:
+        # "PRIMARY KEY (id)" -> "PRIMARY KEY (id, timestamp)"
+        text = text.replace(')', f', {compiler.preparer.quote(partition_key)})', 1)
+    return text
+
+
+def _month_start(moment):
+    return date(moment.year, moment.month, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f'{PARTITIONED_TABLE.name}_p{month.year}_{month.month:02d}'
+
+
+def _default_name():
+    return f'{PARTITIONED_TABLE.name}_default'
+
+
+def _partitions(connection):
+    """Names of the table's existing partitions"""
+    return set(connection.exec_driver_sql(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = %(table)s",
+        {'table': PARTITIONED_TABLE.name}
+    ).scalars())
+
+
+def create_partitions(connection, months_ahead=3):
+    """Create the DEFAULT partition and any missing monthly ones; returns the names created"""
+    if connection.dialect.name != 'postgresql':
+        return []
+    table = PARTITIONED_TABLE.name
+    key = connection.dialect.identifier_preparer.quote(PARTITIONED_TABLE.info['partition_key'])
+    default = _default_name()
+    existing = _partitions(connection)
+    created = []
+
+    if default not in existing:
+        connection.exec_driver_sql(f"CREATE TABLE {default} PARTITION OF {table} DEFAULT")
+        created.append(default)
+
+    month = _month_start(datetime.utcnow())
+    oldest = connection.exec_driver_sql(f"SELECT min({key}) FROM {default}").scalar()
+    if oldest is not None:
+        month = min(month, _month_start(oldest))
+    last = _month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+
+    while month <= last:
+        name = _partition_name(month)
+        if name not in existing:
+            bounds = {'start': month, 'end': _next_month(month)}
+            # Attaching fails while the default partition holds rows of the new
+            # range, so move them into the new table before attaching it
+            connection.exec_driver_sql(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+            connection.exec_driver_sql(
+                f"INSERT INTO {name} SELECT * FROM {default} WHERE {key} >= %(start)s AND {key} < %(end)s", bounds
+            )
+            connection.exec_driver_sql(f"DELETE FROM {default} WHERE {key} >= %(start)s AND {key} < %(end)s", bounds)
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+            )
+            created.append(name)
+        month = _next_month(month)
+    return created
+
+
+def drop_empty_partitions(connection, before):
+    """Drop the monthly partitions wholly before `before` that hold no rows; returns their names"""
+    if connection.dialect.name != 'postgresql':
+        return []
+    dropped = []
+    for name in sorted(_partitions(connection)):
+        if name == _default_name():
+            continue
+        year, month = name.rsplit('_p', 1)[1].split('_')
+        if _next_month(date(int(year), int(month), 1)) > _month_start(before):
+            continue
+        if connection.exec_driver_sql(f"SELECT 1 FROM {name} LIMIT 1").first() is None:
+            connection.exec_driver_sql(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
+
+
+def register_listeners():
+    """Create the partitions of a newly created message table"""
+    @event.listens_for(PARTITIONED_TABLE, 'after_create')
+    def after_create(target, connection, **kw):
+        create_partitions(connection, current_app.config.get('MESSAGE_PARTITIONS_AHEAD', 3))
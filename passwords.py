@@ -0,0 +1,95 @@
+"""Password hashing for business logins.
+
+Hashes use PASSWORD_HASH_METHOD, any werkzeug method string such as
+'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'. Hashes stored with other
+parameters keep working and are replaced at the next successful login.
+
+Hashing is deliberately CPU-bound, so it runs in a process pool of
+PASSWORD_WORKERS processes: a burst of login attempts queues for those
+cores instead of pinning every request thread. Once PASSWORD_MAX_PENDING
+checks are in the pool (including ones whose caller gave up waiting),
+further ones are refused with PasswordHasherBusy rather than queued. The pool's processes are spawned, so a standalone
+script that hashes passwords needs an `if __name__ == '__main__':` guard
+(or PASSWORD_WORKERS=0).
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Too many password checks are already waiting for the hashing pool"""
+
+
+class PasswordHasher:
+    def __init__(self, method='scrypt', workers=0, max_pending=16, timeout=10):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._prefix = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_MAX_PENDING', self.max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._prefix = None
+        atexit.register(self.shutdown)
+
+    def _pool(self):
+        # Like the request threads, the pool must be created after gunicorn forks
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Spawned rather than forked: forking a process with running threads can deadlock
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise PasswordHasherBusy(f"{self.max_pending} password checks already pending")
+        try:
+            future = self._pool().submit(func, *args)
+        except Exception:
+            slots.release()
+            raise
+        # The slot is held until the job leaves the pool, not just until we stop waiting,
+        # so abandoned jobs still count against PASSWORD_MAX_PENDING
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()  # only succeeds while it is still queued
+            raise PasswordHasherBusy(f"Password check took longer than {self.timeout}s")
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether the hash was made with parameters other than PASSWORD_HASH_METHOD"""
+        if self._prefix is None:
+            # werkzeug fills in defaults (e.g. 'scrypt' -> 'scrypt:32768:8:1'), so hash once to learn them
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+password_hasher = PasswordHasher()
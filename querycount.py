@@ -0,0 +1,63 @@
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request issued more SQL statements than QUERY_BUDGET allows"""
+
+
+class QueryCounter:
+    """Context manager recording the statements sent to the database while it is active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    # Only requests of an app with a budget start a count (see init_app), which
+    # gather_stats workers carry on in their own contexts
+    if has_app_context() and 'query_count' in g:
+        g.query_count += 1
+
+
+def register_listeners():
+    event.listen(Engine, 'before_cursor_execute', _count_statement)
+
+
+def init_app(app):
+    """Fail any request that issues more than QUERY_BUDGET statements
+
+    Intended for tests and local runs against seeded data: a view whose
+    statement count grows with the number of rows it shows (an N+1 pattern)
+    trips the budget as soon as there are enough rows.
+    """
+    budget = app.config.get('QUERY_BUDGET')
+    if not budget:
+        return
+
+    @app.before_request
+    def reset_query_count():
+        g.query_count = 0
+
+    @app.after_request
+    def check_query_budget(response):
+        count = g.get('query_count', 0)
+        if count > budget:
+            raise QueryBudgetExceeded(f"{request.endpoint} issued {count} SQL statements (budget {budget})")
+        return response
@@ -0,0 +1,41 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """In-process token buckets, one per key, each holding up to `capacity` tokens
+
+    Buckets refill at `rate` tokens per second. Only the `max_keys` most
+    recently used buckets are kept; an evicted key starts again with a full
+    bucket, which is what a new key gets anyway.
+    """
+
+    def __init__(self, capacity=10, rate=10 / 60, max_keys=10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, now):
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated_at) * self.rate)
+
+    def allow(self, *keys):
+        """Take one token from every key's bucket, or none at all if any of them is empty"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = {key: self._tokens(key, now) for key in keys}
+            allowed = all(available >= 1 for available in tokens.values())
+            for key, available in tokens.items():
+                self._buckets[key] = (available - 1 if allowed else available, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def reset(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._buckets.pop(key, None)
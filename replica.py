@@ -0,0 +1,75 @@
+"""Routing of read-only queries to a database replica.
+
+When DATABASE_REPLICA_URL is set, views decorated with @replica_reads send
+their SELECTs to the replica engine. Everything else uses the primary:
+writes, flushes, SELECT ... FOR UPDATE, raw SQL and every read after the
+session has written in its current transaction.
+
+Replicas lag, so after a request commits a write, its client is pinned to
+the primary for REPLICA_STICKY_SECONDS (a timestamp in the Flask session
+cookie). Clients then read their own writes. Other clients may see them
+only once the replica catches up, and statistics cached from a lagging
+replica can stay behind for up to STATS_CACHE_TTL.
+
+That pin lives in the cookie, so it only covers logged-in dashboard users.
+Requests authenticated by API key (ingest, availability) carry no session
+and always read from the primary, even from a view marked @replica_reads.
+"""
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, session as client_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from metrics import connection_requested
+
+REPLICA_BIND = 'replica'
+STICKY_KEY = '_primary_until'
+
+
+def replica_configured():
+    return REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {})
+
+
+def reads_from_replica():
+    """Whether this context's read-only queries may go to the replica"""
+    return has_app_context() and g.get('replica_reads', False)
+
+
+def replica_reads(view):
+    """Let a read-only view query the replica, unless its client wrote recently"""
+    @wraps(view)
+    def decorated_view(*args, **kwargs):
+        g.replica_reads = (
+            replica_configured() and 'api_business_id' not in g and client_session.get(STICKY_KEY, 0) <= time.time()
+        )
+        return view(*args, **kwargs)
+    return decorated_view
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        connection_requested(self)
+        if bind is None:
+            if self._flushing or (clause is not None and clause.is_dml):
+                self.info['replica_wrote'] = True
+            elif (
+                clause is not None and clause.is_select and getattr(clause, '_for_update_arg', None) is None
+                and not self.info.get('replica_wrote') and reads_from_replica()
+            ):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def register_listeners():
+    """Pin a client to the primary for a while after it commits a write"""
+    @event.listens_for(RoutingSession, 'after_commit')
+    def pin_to_primary(session):
+        if session.info.pop('replica_wrote', False) and has_request_context():
+            g.replica_reads = False
+            sticky_seconds = current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+            if sticky_seconds and replica_configured():
+                client_session[STICKY_KEY] = time.time() + sticky_seconds
+
+    @event.listens_for(RoutingSession, 'after_rollback')
+    def forget_writes(session):
+        session.info.pop('replica_wrote', None)
@@ -0,0 +1,159 @@
+from collections import Counter
+from datetime import date
+from flask import current_app
+from sqlalchemy import event, func, inspect, insert, delete, literal, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import ArchivedInteraction, Business, Interaction, Booking, DailyInteractionRollup, DailyBookingRollup
+
+# Source model -> (rollup model, source time column, source/rollup bucket attribute)
+ROLLUPS = {
+    Interaction: (DailyInteractionRollup, 'start_time', 'interaction_type'),
+    Booking: (DailyBookingRollup, 'booking_time', 'status'),
+}
+
+# Tables whose rows still count towards a source model's rollups
+ARCHIVES = {
+    Interaction: [ArchivedInteraction],
+}
+
+# Rows without a time or bucket are still counted, under these stand-ins: the
+# day is before every range the statistics ask about and the bucket matches no
+# known type or status, so they only show up in totals, as on the raw tables
+UNDATED = date(1, 1, 1)
+NO_BUCKET = ''
+
+UPSERT_DIALECTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _bump(connection, rollup, bucket_attr, key, delta):
+    """Add delta to the rollup row for key = (business_id, day, bucket)"""
+    business_id, day, bucket = key
+    values = {
+        'business_id': business_id,
+        'day': UNDATED if day is None else day,
+        bucket_attr: NO_BUCKET if bucket is None else bucket,
+    }
+
+    dialect_insert = UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(rollup).values(count=delta, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(values),
+            set_={'count': rollup.count + delta}
+        )
+        connection.execute(stmt)
+        return
+
+    # Other databases: update in place, falling back to an insert for a new bucket
+    conditions = [getattr(rollup, name) == value for name, value in values.items()]
+    result = connection.execute(update(rollup).where(*conditions).values(count=rollup.count + delta))
+    if result.rowcount == 0:
+        connection.execute(insert(rollup).values(count=delta, **values))
+
+
+def record_bulk_insert(connection, model, rows):
+    """Count rows written with bulk or Core inserts, which skip the ORM events"""
+    rollup, time_attr, bucket_attr = ROLLUPS[model]
+    counts = Counter(
+        (row['business_id'], row[time_attr].date() if row.get(time_attr) else None, row.get(bucket_attr))
+        for row in rows
+    )
+    for key, delta in counts.items():
+        _bump(connection, rollup, bucket_attr, key, delta)
+
+
+def _rollup_key(target, time_attr, bucket_attr, previous=False):
+    """The (business_id, day, bucket) a row counts towards, optionally before its pending update"""
+    state = inspect(target)
+
+    def value(name):
+        history = state.attrs[name].history
+        if previous and history.deleted:
+            return history.deleted[0]
+        return getattr(target, name)
+
+    moment = value(time_attr)
+    return value('business_id'), moment.date() if moment else None, value(bucket_attr)
+
+
+def _listen(model, rollup, time_attr, bucket_attr):
+    # Load the old value when an expired attribute is assigned (e.g. after a
+    # commit), so after_update can still take the row out of its old bucket
+    for name in ('business_id', time_attr, bucket_attr):
+        event.listen(getattr(model, name), 'set', lambda *args: None, active_history=True)
+
+    @event.listens_for(model, 'after_insert')
+    def after_insert(mapper, connection, target):
+        _bump(connection, rollup, bucket_attr, _rollup_key(target, time_attr, bucket_attr), 1)
+
+    @event.listens_for(model, 'after_update')
+    def after_update(mapper, connection, target):
+        old = _rollup_key(target, time_attr, bucket_attr, previous=True)
+        new = _rollup_key(target, time_attr, bucket_attr)
+        if old != new:
+            _bump(connection, rollup, bucket_attr, old, -1)
+            _bump(connection, rollup, bucket_attr, new, 1)
+
+    @event.listens_for(model, 'after_delete')
+    def after_delete(mapper, connection, target):
+        _bump(connection, rollup, bucket_attr, _rollup_key(target, time_attr, bucket_attr, previous=True), -1)
+
+
+def register_listeners():
+    """Keep the daily rollup tables in step with ORM writes"""
+    for model, (rollup, time_attr, bucket_attr) in ROLLUPS.items():
+        _listen(model, rollup, time_attr, bucket_attr)
+
+
+def use_rollups():
+    """Whether statistics should be read from the rollup tables (enable after a backfill)"""
+    return current_app.config.get('STATS_USE_ROLLUPS', False)
+
+
+def rebuild_rollups(business_ids):
+    """Recompute the rollup rows of the given businesses from the raw and archived tables"""
+    for model, (rollup, time_attr, bucket_attr) in ROLLUPS.items():
+        rows = union_all(*(
+            select(
+                source.business_id, getattr(source, time_attr).label('time'), getattr(source, bucket_attr).label('bucket')
+            ).where(source.business_id.in_(business_ids))
+            for source in [model] + ARCHIVES.get(model, [])
+        )).subquery()
+        day = func.coalesce(func.date(rows.c.time), literal(UNDATED, rollup.day.type))
+        bucket = func.coalesce(rows.c.bucket, NO_BUCKET)
+
+        db.session.execute(delete(rollup).where(rollup.business_id.in_(business_ids)))
+        grouped = select(
+            rows.c.business_id, day, bucket, func.count()
+        ).group_by(rows.c.business_id, day, bucket)
+        db.session.execute(insert(rollup).from_select(
+            ['business_id', 'day', bucket_attr, 'count'], grouped
+        ))
+
+
+def backfill_rollups(batch_size=100):
+    """Rebuild the rollups of every business, committing once per batch of businesses
+
+    Yields the number of businesses done after each batch. Writes made to a
+    business while its batch is being rebuilt may be lost, so run this while
+    ingestion is paused or run it again afterwards.
+    """
+    last_id = 0
+    done = 0
+    while True:
+        business_ids = db.session.execute(
+            select(Business.id).where(Business.id > last_id).order_by(Business.id).limit(batch_size)
+        ).scalars().all()
+        if not business_ids:
+            break
+
+        rebuild_rollups(business_ids)
+        db.session.commit()
+
+        last_id = business_ids[-1]
+        done += len(business_ids)
+        yield done
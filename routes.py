@@ -1,33 +1,116 @@
+import csv
+import hashlib
+import hmac
+import io
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from functools import wraps
 from urllib.parse import urlparse
-from flask import render_template, url_for, flash, redirect, request, jsonify
+from flask import Blueprint, current_app, render_template, url_for, flash, redirect, request, jsonify, abort, g, make_response, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
-from app import app, db
-from models import Business, Customer, Interaction, Message, Booking
-from forms import LoginForm, RegistrationForm, ProfileForm, PasswordChangeForm, ChatbotForm
-from utils import get_interaction_stats, get_booking_stats, get_customer_stats, format_duration
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from app import db
+from dataversion import data_version
+from metrics import render_metrics
+from models import Business, ApiKey, Customer, Interaction, Message, Booking
+from forms import LoginForm, RegistrationForm, ProfileForm, PasswordChangeForm, ChatbotForm, ApiKeyForm, RevokeApiKeyForm
+from ingest import ingest_batch, customers_of, IngestError, SENDER_TYPES
+from writebehind import message_writer, QueueFull
+from usercache import user_cache
+from passwords import password_hasher, PasswordHasherBusy
+from ratelimit import TokenBucketLimiter
+from search import search_conversations
+from replica import replica_reads
+from availability import availability, DEFAULT_DURATION_MINUTES
+from archive import load_archived, ArchiveNotConfigured
+from chatmodel import create_chat_model, ChatModelNotConfigured
+from chatcontext import ContextBuilder
+from utils import get_interaction_stats, get_booking_stats, get_customer_stats, gather_stats, format_duration, paginate_keyset
 
-@app.route('/')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+EXPORT_BATCH_SIZE = 1000
+MAX_BOOKING_MINUTES = 24 * 60
+MAX_AVAILABILITY_RANGE = timedelta(days=31)
+LOOPBACK_ADDRESSES = {'127.0.0.1', '::1'}
+
+bp = Blueprint('main', __name__)
+
+
+@bp.record_once
+def _accept_unprefixed_endpoints(state):
+    """Keep url_for('dashboard') working (e.g. in templates) for what is now main.dashboard"""
+    def build(error, endpoint, values):
+        if '.' not in endpoint and f'{bp.name}.{endpoint}' in state.app.view_functions:
+            return url_for(f'{bp.name}.{endpoint}', **values)
+        return None
+
+    state.app.url_build_error_handlers.append(build)
+
+
+def api_key_required(view):
+    """Authenticate an integration by its `Authorization: Bearer <api key>` header"""
+    @wraps(view)
+    def decorated_view(*args, **kwargs):
+        header = request.headers.get('Authorization', '')
+        api_key = None
+        if header.startswith('Bearer '):
+            api_key = ApiKey.query.filter_by(key_hash=ApiKey.hash_key(header[len('Bearer '):])).first()
+        if api_key is None:
+            return jsonify({'error': 'Invalid or missing API key'}), 401
+        g.api_business_id = api_key.business_id
+        return view(*args, **kwargs)
+    return decorated_view
+
+def _login_limiter():
+    if 'login_limiter' not in current_app.extensions:
+        current_app.extensions['login_limiter'] = TokenBucketLimiter(
+            current_app.config['LOGIN_ATTEMPTS_BURST'], current_app.config['LOGIN_ATTEMPTS_PER_MINUTE'] / 60
+        )
+    return current_app.extensions['login_limiter']
+
+
+def _upgrade_password_hash(business, password):
+    """Rehash a just-verified password whose hash predates the current PASSWORD_HASH_METHOD"""
+    if not password_hasher.needs_rehash(business.password_hash):
+        return
+    try:
+        business.set_password(password)
+    except PasswordHasherBusy:
+        return  # try again at the next login
+    db.session.commit()
+    user_cache.invalidate(business.id)
+
+
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.dashboard'))
     return render_template('landing.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.dashboard'))
     
     form = LoginForm()
     if form.validate_on_submit():
+        email_key = f'email:{form.email.data.strip().lower()}'
+        # Refuse before hashing anything, so a burst of guesses costs no CPU
+        if not _login_limiter().allow(email_key, f'ip:{request.remote_addr}'):
+            flash('Too many login attempts. Please wait a minute and try again.', 'danger')
+            return render_template('auth/login.html', form=form), 429
+        
         business = Business.query.filter_by(email=form.email.data).first()
         if business and business.check_password(form.password.data):
+            _login_limiter().reset(email_key)
+            _upgrade_password_hash(business, form.password.data)
             login_user(business)
             next_page = request.args.get('next')
             if not next_page or urlparse(next_page).netloc != '':
-                next_page = url_for('dashboard')
+                next_page = url_for('.dashboard')
             return redirect(next_page)
         else:
             flash('Invalid email or password', 'danger')
@@ -35,10 +118,10 @@ def login():
     return render_template('auth/login.html', form=form)
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('.dashboard'))
     
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -55,77 +138,282 @@ def register():
         db.session.commit()
         
         flash('Your account has been created! You can now log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
     return render_template('auth/register.html', form=form)
 
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
+@replica_reads
 def dashboard():
-    interaction_stats = get_interaction_stats(current_user.id)
-    booking_stats = get_booking_stats(current_user.id)
-    customer_stats = get_customer_stats(current_user.id)
-    
-    # Get recent interactions
-    recent_interactions = Interaction.query.filter_by(business_id=current_user.id).order_by(Interaction.start_time.desc()).limit(5).all()
-    
-    # Get upcoming bookings
-    upcoming_bookings = Booking.query.filter(
-        Booking.business_id == current_user.id,
-        Booking.booking_time > datetime.utcnow(),
-        Booking.status == 'scheduled'
-    ).order_by(Booking.booking_time).limit(5).all()
+    interaction_stats, booking_stats, customer_stats = gather_stats(current_user.id)
     
     return render_template(
         'dashboard/index.html',
         interaction_stats=interaction_stats,
         booking_stats=booking_stats,
         customer_stats=customer_stats,
-        recent_interactions=recent_interactions,
-        upcoming_bookings=upcoming_bookings,
+        recent_interactions=_recent_interactions(current_user.id),
+        upcoming_bookings=_upcoming_bookings(current_user.id),
         format_duration=format_duration
     )
 
 
-@app.route('/dashboard/interactions')
+def _recent_interactions(business_id, limit=5):
+    return Interaction.query.options(joinedload(Interaction.customer)).filter_by(
+        business_id=business_id
+    ).order_by(Interaction.start_time.desc()).limit(limit).all()
+
+
+def _upcoming_filter(business_id, now):
+    return (
+        Booking.business_id == business_id,
+        Booking.booking_time > now,
+        Booking.status == 'scheduled'
+    )
+
+
+def _upcoming_bookings(business_id, limit=5):
+    return Booking.query.options(joinedload(Booking.customer)).filter(
+        *_upcoming_filter(business_id, datetime.utcnow())
+    ).order_by(Booking.booking_time).limit(limit).all()
+
+
+def _date_arg(name):
+    """Parse an optional YYYY-MM-DD query argument"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        abort(400, description=f"Invalid {name} date, expected YYYY-MM-DD")
+
+
+def _datetime_arg(name, default=None):
+    """Parse an optional ISO 8601 query argument into the naive UTC datetimes stored by the models"""
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"Invalid {name}, expected an ISO 8601 date and time")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _duration_arg():
+    duration = request.args.get('duration', DEFAULT_DURATION_MINUTES, type=int)
+    if not 0 < duration <= MAX_BOOKING_MINUTES:
+        abort(400, description=f"duration must be between 1 and {MAX_BOOKING_MINUTES} minutes")
+    return duration
+
+
+def _page_args():
+    """Return the (cursor, per_page) pagination arguments of the request"""
+    per_page = request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int)
+    return request.args.get('cursor'), max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def _filtered_interactions():
+    """Interactions of the current business, filtered by type and date range"""
+    query = Interaction.query.filter(Interaction.business_id == current_user.id)
+    
+    interaction_type = request.args.get('type')
+    if interaction_type:
+        query = query.filter(Interaction.interaction_type == interaction_type)
+    
+    start = _date_arg('start')
+    if start:
+        query = query.filter(Interaction.start_time >= start)
+    
+    end = _date_arg('end')
+    if end:
+        query = query.filter(Interaction.start_time < end + timedelta(days=1))
+    
+    return query
+
+
+def _filtered_bookings():
+    """Bookings of the current business, filtered by status and date range"""
+    query = Booking.query.filter(Booking.business_id == current_user.id)
+    
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Booking.status == status)
+    
+    start = _date_arg('start')
+    if start:
+        query = query.filter(Booking.booking_time >= start)
+    
+    end = _date_arg('end')
+    if end:
+        query = query.filter(Booking.booking_time < end + timedelta(days=1))
+    
+    return query
+
+
+def _paginate(query, column, id_column):
+    """Apply the request's keyset pagination to query"""
+    cursor, per_page = _page_args()
+    try:
+        return paginate_keyset(query, column, id_column, cursor, per_page)
+    except ValueError:
+        abort(400, description="Invalid cursor")
+
+
+def _csv_response(filename, header, rows):
+    """Stream rows as a CSV attachment without building the file in memory"""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() > 8192:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+def _interaction_json(interaction):
+    return {
+        'id': interaction.id,
+        'customer_id': interaction.customer_id,
+        'type': interaction.interaction_type,
+        'start_time': interaction.start_time.isoformat() if interaction.start_time else None,
+        'end_time': interaction.end_time.isoformat() if interaction.end_time else None,
+        'duration': interaction.duration,
+        'summary': interaction.summary
+    }
+
+
+def _booking_json(booking):
+    return {
+        'id': booking.id,
+        'customer_id': booking.customer_id,
+        'service': booking.service,
+        'booking_time': booking.booking_time.isoformat(),
+        'duration': booking.duration,
+        'status': booking.status,
+        'notes': booking.notes
+    }
+
+
+@bp.route('/dashboard/interactions')
 @login_required
+@replica_reads
 def interactions():
-    interactions = Interaction.query.filter_by(business_id=current_user.id).order_by(Interaction.start_time.desc()).all()
-    return render_template('dashboard/interactions.html', interactions=interactions, format_duration=format_duration)
+    query = _filtered_interactions().options(joinedload(Interaction.customer))
+    interactions, next_cursor = _paginate(query, Interaction.start_time, Interaction.id)
+    return render_template(
+        'dashboard/interactions.html',
+        interactions=interactions,
+        next_cursor=next_cursor,
+        filters=request.args,
+        format_duration=format_duration
+    )
+
+
+@bp.route('/dashboard/interactions/export.csv')
+@login_required
+@replica_reads
+def export_interactions():
+    rows = _filtered_interactions().join(Customer).with_entities(
+        Interaction.id,
+        Customer.name,
+        Interaction.interaction_type,
+        Interaction.start_time,
+        Interaction.end_time,
+        Interaction.duration,
+        Interaction.summary
+    ).order_by(Interaction.start_time.desc(), Interaction.id.desc()).yield_per(EXPORT_BATCH_SIZE)
+    
+    header = ['id', 'customer', 'type', 'start_time', 'end_time', 'duration', 'summary']
+    return _csv_response('interactions.csv', header, rows)
 
 
-@app.route('/dashboard/interaction/<int:interaction_id>')
+@bp.route('/dashboard/interaction/<int:interaction_id>')
 @login_required
+@replica_reads
 def interaction_detail(interaction_id):
-    interaction = Interaction.query.get_or_404(interaction_id)
+    interaction = db.session.get(Interaction, interaction_id, options=[joinedload(Interaction.customer)])
+    if interaction is None:
+        # Old conversations live in the monthly archive files (see archive.py)
+        try:
+            archived = load_archived(current_user.id, interaction_id)
+        except (ArchiveNotConfigured, OSError) as e:
+            # e.g. an instance without the archive volume, or a file gone missing
+            current_app.logger.error(f"Could not read archived interaction {interaction_id}: {e}")
+            return render_template(
+                'error.html', error_code=503, error_message='This archived conversation is unavailable right now'
+            ), 503
+        if archived is None:
+            abort(404)
+        interaction, messages = archived
+        return render_template('dashboard/interaction_detail.html', interaction=interaction, messages=messages)
     
     # Security check - ensure the interaction belongs to the current business
     if interaction.business_id != current_user.id:
         flash('Access denied.', 'danger')
-        return redirect(url_for('interactions'))
+        return redirect(url_for('.interactions'))
     
     messages = Message.query.filter_by(interaction_id=interaction.id).order_by(Message.timestamp).all()
     
     return render_template('dashboard/interaction_detail.html', interaction=interaction, messages=messages)
 
 
-@app.route('/dashboard/bookings')
+@bp.route('/dashboard/bookings')
 @login_required
+@replica_reads
 def bookings():
-    bookings = Booking.query.filter_by(business_id=current_user.id).order_by(Booking.booking_time.desc()).all()
-    return render_template('dashboard/bookings.html', bookings=bookings)
+    query = _filtered_bookings().options(joinedload(Booking.customer))
+    bookings, next_cursor = _paginate(query, Booking.booking_time, Booking.id)
+    return render_template(
+        'dashboard/bookings.html',
+        bookings=bookings,
+        next_cursor=next_cursor,
+        filters=request.args
+    )
 
 
-@app.route('/dashboard/profile', methods=['GET', 'POST'])
+@bp.route('/dashboard/bookings/export.csv')
+@login_required
+@replica_reads
+def export_bookings():
+    rows = _filtered_bookings().join(Customer).with_entities(
+        Booking.id,
+        Customer.name,
+        Booking.service,
+        Booking.booking_time,
+        Booking.duration,
+        Booking.status,
+        Booking.notes
+    ).order_by(Booking.booking_time.desc(), Booking.id.desc()).yield_per(EXPORT_BATCH_SIZE)
+    
+    header = ['id', 'customer', 'service', 'booking_time', 'duration', 'status', 'notes']
+    return _csv_response('bookings.csv', header, rows)
+
+
+@bp.route('/dashboard/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     form = ProfileForm()
@@ -137,37 +425,82 @@ def profile():
         form.address.data = current_user.address
     
     if form.validate_on_submit():
-        current_user.business_name = form.business_name.data
-        current_user.business_type = form.business_type.data
-        current_user.phone = form.phone.data
-        current_user.address = form.address.data
+        # current_user is a cached, detached snapshot; change the stored row instead
+        business = db.session.get(Business, current_user.id)
+        business.business_name = form.business_name.data
+        business.business_type = form.business_type.data
+        business.phone = form.phone.data
+        business.address = form.address.data
         
         db.session.commit()
+        user_cache.invalidate(business.id)
         flash('Your profile has been updated!', 'success')
-        return redirect(url_for('profile'))
+        return redirect(url_for('.profile'))
     
-    password_form = PasswordChangeForm()
+    return _render_profile(form)
+
+
+def _render_profile(form, new_api_key=None):
+    api_keys = ApiKey.query.filter_by(business_id=current_user.id).order_by(ApiKey.created_at).all()
+    return render_template(
+        'dashboard/profile.html', form=form, password_form=PasswordChangeForm(), api_key_form=ApiKeyForm(),
+        revoke_api_key_form=RevokeApiKeyForm(), api_keys=api_keys, new_api_key=new_api_key
+    )
+
+
+@bp.route('/dashboard/api-keys', methods=['POST'])
+@login_required
+def create_api_key():
+    form = ApiKeyForm()
+    
+    if form.validate_on_submit():
+        api_key = ApiKey(business_id=current_user.id)
+        key = api_key.set_key()
+        db.session.add(api_key)
+        db.session.commit()
+        # Shown in this response only: flashed messages live in the (unencrypted) session cookie
+        response = make_response(_render_profile(ProfileForm(formdata=None, obj=current_user), new_api_key=key))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    return redirect(url_for('.profile'))
+
+
+@bp.route('/dashboard/api-keys/<int:key_id>/revoke', methods=['POST'])
+@login_required
+def revoke_api_key(key_id):
+    form = RevokeApiKeyForm()
     
-    return render_template('dashboard/profile.html', form=form, password_form=password_form)
+    if form.validate_on_submit():
+        deleted = ApiKey.query.filter_by(id=key_id, business_id=current_user.id).delete()
+        db.session.commit()
+        if deleted:
+            flash('The API key has been revoked.', 'success')
+        else:
+            flash('API key not found.', 'danger')
+    
+    return redirect(url_for('.profile'))
 
 
-@app.route('/dashboard/change-password', methods=['POST'])
+@bp.route('/dashboard/change-password', methods=['POST'])
 @login_required
 def change_password():
     form = PasswordChangeForm()
     
     if form.validate_on_submit():
-        if current_user.check_password(form.current_password.data):
-            current_user.set_password(form.new_password.data)
+        business = db.session.get(Business, current_user.id)
+        if business.check_password(form.current_password.data):
+            business.set_password(form.new_password.data)
             db.session.commit()
+            user_cache.invalidate(business.id)
             flash('Your password has been updated!', 'success')
         else:
             flash('Current password is incorrect.', 'danger')
     
-    return redirect(url_for('profile'))
+    return redirect(url_for('.profile'))
 
 
-@app.route('/dashboard/chatbot', methods=['GET', 'POST'])
+@bp.route('/dashboard/chatbot', methods=['GET', 'POST'])
 @login_required
 def chatbot():
     form = ChatbotForm()
@@ -175,33 +508,317 @@ def chatbot():
     return render_template('dashboard/chatbot.html', form=form)
 
 
-@app.route('/api/charts/interactions')
+def _chat_model():
+    if 'chat_model' not in current_app.extensions:
+        current_app.extensions['chat_model'] = create_chat_model(current_app.config)
+    return current_app.extensions['chat_model']
+
+
+def _context_builder():
+    if 'chat_context' not in current_app.extensions:
+        current_app.extensions['chat_context'] = ContextBuilder(
+            _chat_model(),
+            recent_messages=current_app.config['CHAT_CONTEXT_MESSAGES'],
+            summarize_every=current_app.config['CHAT_SUMMARY_EVERY'],
+            token_budget=current_app.config['CHAT_TOKEN_BUDGET'],
+            workers=current_app.config['CHAT_SUMMARY_WORKERS']
+        )
+    return current_app.extensions['chat_context']
+
+
+def _sse(data, event=None):
+    """Format one Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ''
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+def _chat_interaction(interaction_id):
+    """The conversation to continue, or a new chat with the business itself as the customer
+
+    These test chats are stored like any other chat, so they count in the
+    business's interaction statistics; the business appears once among its
+    own customers, as a returning customer.
+    """
+    if interaction_id:
+        interaction = Interaction.query.filter_by(id=interaction_id, business_id=current_user.id).first()
+        if interaction is None:
+            abort(404)
+        return interaction
+    
+    customer = Customer.query.filter(
+        Customer.email == current_user.email, Customer.id.in_(customers_of(current_user.id))
+    ).order_by(Customer.id).first()
+    if customer is None:
+        customer = Customer(name=current_user.business_name, email=current_user.email, is_new=False)
+        db.session.add(customer)
+    interaction = Interaction(business_id=current_user.id, customer=customer, interaction_type='chat')
+    db.session.add(interaction)
+    db.session.commit()
+    return interaction
+
+
+@bp.route('/dashboard/chatbot/stream', methods=['POST'])
 @login_required
+def chatbot_stream():
+    form = ChatbotForm()
+    if not form.validate_on_submit():
+        return jsonify({'error': 'A message is required'}), 400
+    
+    try:
+        model = _chat_model()
+    except ChatModelNotConfigured as e:
+        current_app.logger.error(f"Chatbot unavailable: {e}")
+        return Response(
+            _sse({'error': 'The assistant is unavailable, please try again.'}, event='error'),
+            mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'}
+        )
+    
+    interaction = _chat_interaction(request.form.get('interaction_id', type=int))
+    interaction_id = interaction.id
+    
+    prompt = _context_builder().build(
+        interaction_id,
+        f"You are the AI assistant for {current_user.business_name}.",
+        form.message.data
+    )
+    
+    received_at = datetime.utcnow()
+    
+    def generate():
+        # The reply is sent token by token as it is generated. The customer's
+        # message is persisted (through the write-behind buffer) up front, the
+        # reply only once it is complete: a failed model call or a client that
+        # disconnects mid-stream leaves no partial reply behind
+        yield _sse({'interaction_id': interaction_id}, event='start')
+        try:
+            message_writer.enqueue_message(interaction_id, 'customer', form.message.data, received_at)
+        except QueueFull:
+            yield _sse({'error': 'The service is busy, please try again.'}, event='error')
+            return
+        tokens = []
+        try:
+            for token in model.stream_reply(prompt):
+                tokens.append(token)
+                yield _sse({'token': token})
+        except Exception:
+            current_app.logger.exception("Chat model failed")
+            yield _sse({'error': 'The assistant is unavailable, please try again.'}, event='error')
+            return
+        try:
+            message_writer.enqueue_message(interaction_id, 'bot', ''.join(tokens))
+        except QueueFull:
+            current_app.logger.warning(f"Dropped the reply to interaction {interaction_id}: message buffer full")
+            yield _sse({'error': 'The reply could not be saved, please try again.'}, event='error')
+            return
+        yield _sse({'interaction_id': interaction_id}, event='done')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@bp.route('/api/charts/interactions')
+@login_required
+@replica_reads
 def api_interactions_chart():
     interaction_stats = get_interaction_stats(current_user.id)
     return jsonify(interaction_stats)
 
 
-@app.route('/api/charts/bookings')
+@bp.route('/api/charts/bookings')
 @login_required
+@replica_reads
 def api_bookings_chart():
     booking_stats = get_booking_stats(current_user.id)
     return jsonify(booking_stats)
 
 
-@app.route('/api/charts/customer-types')
+@bp.route('/api/charts/customer-types')
 @login_required
+@replica_reads
 def api_customer_types_chart():
     customer_stats = get_customer_stats(current_user.id)
     return jsonify(customer_stats)
 
 
+def _dashboard_etag(business_id):
+    """Strong ETag for the dashboard payload, found without running the aggregate queries
+
+    The payload only changes when the business's data does (its data version),
+    when the day rolls over (the daily figures) or when the next upcoming
+    booking's time passes (the upcoming count and list).
+    """
+    now = datetime.utcnow()
+    next_booking_id = db.session.execute(
+        select(Booking.id).where(*_upcoming_filter(business_id, now)).order_by(Booking.booking_time).limit(1)
+    ).scalar()
+    version = data_version(business_id)
+    key = f"{business_id}:{version.isoformat() if version else ''}:{now.date().isoformat()}:{next_booking_id}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+@bp.route('/api/dashboard')
+@login_required
+@replica_reads
+def api_dashboard():
+    etag = _dashboard_etag(current_user.id)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        # Bypass the stats cache: an entry from before the ETag's day or next
+        # booking changed would otherwise be pinned by later 304s
+        interaction_stats, booking_stats, customer_stats = gather_stats(current_user.id, cached=False)
+        response = jsonify({
+            'interaction_stats': interaction_stats,
+            'booking_stats': booking_stats,
+            'customer_stats': customer_stats,
+            'recent_interactions': [
+                {**_interaction_json(interaction), 'customer_name': interaction.customer.name}
+                for interaction in _recent_interactions(current_user.id)
+            ],
+            'upcoming_bookings': [
+                {**_booking_json(booking), 'customer_name': booking.customer.name}
+                for booking in _upcoming_bookings(current_user.id)
+            ],
+        })
+    response.set_etag(etag)
+    # Let browsers keep the payload but revalidate it on every refresh
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@bp.route('/api/interactions')
+@login_required
+@replica_reads
+def api_interactions():
+    interactions, next_cursor = _paginate(_filtered_interactions(), Interaction.start_time, Interaction.id)
+    return jsonify({
+        'items': [_interaction_json(interaction) for interaction in interactions],
+        'next_cursor': next_cursor
+    })
+
+
+@bp.route('/api/bookings')
+@login_required
+@replica_reads
+def api_bookings():
+    bookings, next_cursor = _paginate(_filtered_bookings(), Booking.booking_time, Booking.id)
+    return jsonify({
+        'items': [_booking_json(booking) for booking in bookings],
+        'next_cursor': next_cursor
+    })
+
+
+@bp.route('/api/availability')
+@api_key_required
+def api_availability():
+    """Free intervals long enough for a booking of `duration` minutes between start and end"""
+    start = _datetime_arg('start', datetime.utcnow())
+    end = _datetime_arg('end', start + timedelta(days=7))
+    duration = _duration_arg()
+    if not start < end <= start + MAX_AVAILABILITY_RANGE:
+        abort(400, description=f"end must be after start and at most {MAX_AVAILABILITY_RANGE.days} days later")
+    
+    free = availability.free_slots(g.api_business_id, start, end, duration)
+    return jsonify({
+        'duration': duration,
+        'free': [{'start': slot_start.isoformat(), 'end': slot_end.isoformat()} for slot_start, slot_end in free]
+    })
+
+
+@bp.route('/api/availability/conflicts')
+@api_key_required
+def api_availability_conflicts():
+    """The bookings a new booking of `duration` minutes at start would overlap"""
+    start = _datetime_arg('start')
+    if start is None:
+        abort(400, description="Missing start")
+    conflicts = availability.conflicts(g.api_business_id, start, _duration_arg())
+    return jsonify({'available': not conflicts, 'conflicts': conflicts})
+
+
+@bp.route('/api/search')
+@login_required
+@replica_reads
+def api_search():
+    terms = request.args.get('q', '').strip()
+    if not terms:
+        abort(400, description="Missing search terms (q)")
+    page = max(1, request.args.get('page', 1, type=int))
+    _, per_page = _page_args()
+    
+    hits, next_page = search_conversations(current_user.id, terms, page, per_page)
+    return jsonify({
+        'items': [
+            {
+                'kind': hit['kind'],
+                'message_id': hit['message_id'],
+                'rank': hit['rank'],
+                'snippet': hit['snippet'],
+                'interaction': {**_interaction_json(hit['interaction']), 'customer_name': hit['interaction'].customer.name},
+            }
+            for hit in hits
+        ],
+        'next_page': next_page
+    })
+
+
+@bp.route('/api/ingest', methods=['POST'])
+@api_key_required
+def api_ingest():
+    payload = request.get_json(silent=True)
+    try:
+        result = ingest_batch(g.api_business_id, payload)
+    except IngestError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result), 201
+
+
+@bp.route('/api/interactions/<int:interaction_id>/messages', methods=['POST'])
+@api_key_required
+def api_add_message(interaction_id):
+    business_id = db.session.query(Interaction.business_id).filter_by(id=interaction_id).scalar()
+    if business_id != g.api_business_id:
+        return jsonify({'error': 'Interaction not found'}), 404
+    
+    payload = request.get_json(silent=True) or {}
+    sender_type = payload.get('sender_type')
+    content = payload.get('content')
+    if sender_type not in SENDER_TYPES or not isinstance(content, str) or not content:
+        return jsonify({'error': f"Expected sender_type ({', '.join(sorted(SENDER_TYPES))}) and non-empty content"}), 400
+    
+    try:
+        message_writer.enqueue_message(interaction_id, sender_type, content)
+    except QueueFull:
+        return jsonify({'error': 'Too many pending messages, retry shortly'}), 503, {'Retry-After': '1'}
+    return jsonify({'status': 'accepted'}), 202
+
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    # Without a token only a scraper on the same host may read the metrics
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+    elif request.remote_addr not in LOOPBACK_ADDRESSES:
+        abort(403)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
 # Error handlers
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def page_not_found(e):
     return render_template('error.html', error_code=404, error_message='Page not found'), 404
 
 
-@app.errorhandler(500)
+@bp.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    return render_template('error.html', error_code=503, error_message='Too many sign-ins right now, please try again shortly'), 503
+
+
+@bp.app_errorhandler(500)
 def server_error(e):
     return render_template('error.html', error_code=500, error_message='Server error'), 500
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""Full-text search over message content and interaction summaries.
+
+PostgreSQL matches through GIN indexes on to_tsvector(content) and
+to_tsvector(summary) (declared in models.py), which the database keeps up
+to date on every write. SQLite, for local runs, uses two FTS5 tables kept
+in step by triggers, so rows written through the ORM, Core bulk inserts and
+the write-behind buffer are all indexed. Each FTS5 row carries its
+business as an indexed token, so a search only reads the business's own
+postings.
+"""
+from sqlalchemy import event, func, literal, null, select, text, union_all
+from sqlalchemy.orm import joinedload
+from app import db
+from models import TEXT_SEARCH_CONFIG, Interaction, Message
+
+HIGHLIGHT = ('**', '**')
+
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(body, business, interaction_id UNINDEXED)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS interaction_fts USING fts5(body, business)",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN
+        INSERT INTO message_fts (rowid, body, business, interaction_id)
+        SELECT new.id, new.content, 'b' || business_id, new.interaction_id FROM interaction WHERE id = new.interaction_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF content ON message BEGIN
+        UPDATE message_fts SET body = new.content WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN
+        DELETE FROM message_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS interaction_fts_insert AFTER INSERT ON interaction
+    WHEN new.summary IS NOT NULL BEGIN
+        INSERT INTO interaction_fts (rowid, body, business) VALUES (new.id, new.summary, 'b' || new.business_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS interaction_fts_update AFTER UPDATE OF summary ON interaction BEGIN
+        DELETE FROM interaction_fts WHERE rowid = old.id;
+        INSERT INTO interaction_fts (rowid, body, business)
+        SELECT new.id, new.summary, 'b' || new.business_id WHERE new.summary IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS interaction_fts_delete AFTER DELETE ON interaction BEGIN
+        DELETE FROM interaction_fts WHERE rowid = old.id;
+    END""",
+]
+
+SQLITE_BACKFILL = [
+    """INSERT INTO message_fts (rowid, body, business, interaction_id)
+    SELECT message.id, message.content, 'b' || interaction.business_id, message.interaction_id
+    FROM message JOIN interaction ON interaction.id = message.interaction_id""",
+    """INSERT INTO interaction_fts (rowid, body, business)
+    SELECT id, summary, 'b' || business_id FROM interaction WHERE summary IS NOT NULL""",
+]
+
+
+def create_search_index(connection):
+    """Create the SQLite FTS5 tables and triggers, indexing existing rows the first time"""
+    if connection.dialect.name != 'sqlite':
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'"
+    ).first()
+    for statement in SQLITE_SCHEMA:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        for statement in SQLITE_BACKFILL:
+            connection.exec_driver_sql(statement)
+
+
+def register_listeners():
+    """Create the SQLite search tables along with the rest of the schema"""
+    @event.listens_for(db.metadata, 'after_create')
+    def after_create(target, connection, **kw):
+        create_search_index(connection)
+
+
+def _fts5_query(business_id, terms):
+    """Every term as a quoted phrase (so user input can't inject FTS5 syntax), in the body of the business's rows"""
+    phrases = ' '.join('"' + term.replace('"', '""') + '"' for term in terms.split())
+    return f'business:b{business_id} AND body:({phrases})'
+
+
+def _search_sqlite(business_id, terms, limit, offset):
+    # bm25() is lower for better matches, so it is negated to rank like PostgreSQL's
+    # ts_rank (higher is better); the business column carries no weight
+    return db.session.execute(text("""
+        SELECT 'message' AS kind, interaction_id, rowid AS message_id,
+               -bm25(message_fts, 1.0, 0.0) AS rank,
+               snippet(message_fts, 0, :start, :end, '...', 16) AS snippet
+        FROM message_fts WHERE message_fts MATCH :query
+        UNION ALL
+        SELECT 'summary', rowid, NULL,
+               -bm25(interaction_fts, 1.0, 0.0),
+               snippet(interaction_fts, 0, :start, :end, '...', 16)
+        FROM interaction_fts WHERE interaction_fts MATCH :query
+        ORDER BY rank DESC, interaction_id DESC, message_id DESC
+        LIMIT :limit OFFSET :offset
+    """), {
+        'query': _fts5_query(business_id, terms),
+        'start': HIGHLIGHT[0],
+        'end': HIGHLIGHT[1],
+        'limit': limit,
+        'offset': offset,
+    }).all()
+
+
+def _search_postgresql(business_id, terms, limit, offset):
+    query = func.plainto_tsquery(TEXT_SEARCH_CONFIG, terms)
+    # Same expressions as the GIN indexes, so the planner can use them
+    content = func.to_tsvector(TEXT_SEARCH_CONFIG, Message.content)
+    summary = func.to_tsvector(TEXT_SEARCH_CONFIG, Interaction.summary)
+
+    hits = union_all(
+        select(
+            literal('message').label('kind'), Message.interaction_id, Message.id.label('message_id'),
+            func.ts_rank(content, query).label('rank'), Message.content.label('body')
+        ).join(Interaction, Interaction.id == Message.interaction_id).where(
+            Interaction.business_id == business_id, content.bool_op('@@')(query)
+        ),
+        select(
+            literal('summary'), Interaction.id, null(),
+            func.ts_rank(summary, query), Interaction.summary
+        ).where(
+            Interaction.business_id == business_id, summary.bool_op('@@')(query)
+        )
+    ).subquery()
+
+    ordering = (hits.c.rank.desc(), hits.c.interaction_id.desc(), hits.c.message_id.desc().nulls_last())
+    page = select(hits).order_by(*ordering).limit(limit).offset(offset).subquery()
+    # Highlight only the rows of this page; ts_headline re-parses the whole text
+    headline_options = f'StartSel={HIGHLIGHT[0]}, StopSel={HIGHLIGHT[1]}, MaxFragments=1, MaxWords=24, MinWords=8'
+    return db.session.execute(
+        select(
+            page.c.kind, page.c.interaction_id, page.c.message_id, page.c.rank,
+            func.ts_headline(TEXT_SEARCH_CONFIG, page.c.body, query, headline_options).label('snippet')
+        ).order_by(page.c.rank.desc(), page.c.interaction_id.desc(), page.c.message_id.desc().nulls_last())
+    ).all()
+
+
+SEARCH_BACKENDS = {
+    'postgresql': _search_postgresql,
+    'sqlite': _search_sqlite,
+}
+
+
+def search_conversations(business_id, terms, page=1, per_page=20):
+    """Return one page of the business's messages and summaries matching every term, best first
+
+    Each hit is a dict with kind ('message' or 'summary'), its interaction
+    (customer loaded), message_id, rank (higher is better, on every backend)
+    and a highlighted snippet, plus the number of the next page or None.
+    """
+    backend = SEARCH_BACKENDS.get(db.session.get_bind().dialect.name)
+    if backend is None:
+        raise NotImplementedError(f"Search is not supported on {db.session.get_bind().dialect.name}")
+    if not terms.split():
+        return [], None
+
+    rows = backend(business_id, terms, per_page + 1, (page - 1) * per_page)
+    next_page = page + 1 if len(rows) > per_page else None
+    rows = rows[:per_page]
+
+    interactions = {
+        interaction.id: interaction
+        for interaction in Interaction.query.options(joinedload(Interaction.customer)).filter(
+            Interaction.id.in_({row.interaction_id for row in rows})
+        )
+    }
+    hits = [
+        {
+            'kind': row.kind,
+            'interaction': interactions[row.interaction_id],
+            'message_id': row.message_id,
+            'rank': row.rank,
+            'snippet': row.snippet,
+        }
+        for row in rows
+        if row.interaction_id in interactions
+    ]
+    return hits, next_page
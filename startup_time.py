@@ -0,0 +1,79 @@
+"""Measure how long a fresh worker takes to import the app and serve its first request.
+
+Each round starts a new interpreter, as gunicorn does when autoscaling adds
+an instance, against the same DATABASE_URL the app would use:
+
+    python startup_time.py --rounds 10
+    python startup_time.py --imports 15    # slowest imports, from python -X importtime
+
+Run `flask --app main init-db` first; creating tables is no longer part of startup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+app.test_client().get(%r)
+served = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'first_request_s': served - imported}))
+"""
+
+
+def _run_child(url, extra_args=()):
+    result = subprocess.run(
+        [sys.executable, *extra_args, '-c', CHILD % url],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    return result
+
+
+def measure(rounds, url):
+    samples = [json.loads(_run_child(url).stdout.strip().splitlines()[-1]) for _ in range(rounds)]
+    report = {}
+    for key in ('import_s', 'first_request_s'):
+        values = sorted(sample[key] for sample in samples)
+        report[key] = {
+            'min_ms': round(values[0] * 1000, 1),
+            'median_ms': round(statistics.median(values) * 1000, 1),
+            'max_ms': round(values[-1] * 1000, 1),
+        }
+    return report
+
+
+def slowest_imports(url, count):
+    """The modules whose own import code took longest in one cold start, from python -X importtime"""
+    stderr = _run_child(url, ['-X', 'importtime']).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        timings.append((int(own), int(cumulative), module.strip()))
+    return [
+        {'module': module, 'self_ms': round(own / 1000, 1), 'cumulative_ms': round(cumulative / 1000, 1)}
+        for own, cumulative, module in sorted(timings, reverse=True)[:count]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--url', default='/metrics', help='Path requested as the first request.')
+    parser.add_argument('--imports', type=int, default=0, help='Also list this many of the slowest imports.')
+    args = parser.parse_args()
+
+    report = {'rounds': args.rounds, 'url': args.url, 'results': measure(args.rounds, args.url)}
+    if args.imports:
+        report['slowest_imports'] = slowest_imports(args.url, args.imports)
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+from jinja2 import ChoiceLoader, DictLoader
+
+from app import create_app, db
+from models import Business, Customer, Interaction, Message, Booking
+
+# The dashboard templates aren't part of this repository; these stand-ins
+# touch the same relationships the real pages render
+TEMPLATES = {
+    'dashboard/interactions.html': '{% for i in interactions %}{{ i.customer.name }} {{ i.interaction_type }}\n{% endfor %}',
+    'dashboard/bookings.html': '{% for b in bookings %}{{ b.customer.name }} {{ b.service }}\n{% endfor %}',
+    'dashboard/interaction_detail.html': '{{ interaction.customer.name }}{% for m in messages %}\n{{ m.content }}{% endfor %}',
+    'dashboard/profile.html': '{{ new_api_key or "" }}{% for key in api_keys %}\nkey {{ key.id }}{% endfor %}',
+    'auth/login.html': '{% for message in get_flashed_messages() %}{{ message }}\n{% endfor %}',
+    'error.html': '{{ error_code }} {{ error_message }}',
+}
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'WTF_CSRF_ENABLED': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'PASSWORD_WORKERS': 0,
+        'STATS_WORKERS': 0,
+        'ARCHIVE_DIR': str(tmp_path / 'archive'),
+    })
+    app.jinja_env.loader = ChoiceLoader([DictLoader(TEMPLATES), app.jinja_env.loader])
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def business(app):
+    with app.app_context():
+        return add_business('clinic@example.com')
+
+
+@pytest.fixture
+def client(app, business):
+    """A test client logged in as `business`"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(business)
+        session['_fresh'] = True
+    return client
+
+
+def add_business(email):
+    business = Business(business_name=email.split('@')[0], email=email, business_type='clinic')
+    business.set_password('password123')
+    db.session.add(business)
+    db.session.commit()
+    return business.id
+
+
+def add_interactions(business_id, count, messages=0, start=None):
+    """Give the business `count` interactions, each with its own customer; returns their ids"""
+    start = start or datetime.utcnow() - timedelta(hours=count)
+    ids = []
+    for i in range(count):
+        customer = Customer(name=f'Customer {i}', email=f'customer{i}.{business_id}@example.com')
+        interaction = Interaction(
+            business_id=business_id, customer=customer, interaction_type='chat',
+            start_time=start + timedelta(hours=i)
+        )
+        interaction.messages = [
+            Message(sender_type='customer', content=f'Message {j} of conversation {i}',
+                    timestamp=start + timedelta(hours=i, minutes=j))
+            for j in range(messages)
+        ]
+        db.session.add(interaction)
+        db.session.flush()
+        ids.append(interaction.id)
+    db.session.commit()
+    return ids
+
+
+def add_bookings(business_id, count):
+    start = datetime.utcnow() + timedelta(days=1)
+    for i in range(count):
+        customer = Customer(name=f'Booker {i}', phone=f'555-{business_id:03d}-{i:04d}')
+        db.session.add(Booking(business_id=business_id, customer=customer, service='Checkup',
+                               booking_time=start + timedelta(hours=i), duration=30))
+    db.session.commit()
@@ -0,0 +1,86 @@
+from app import db
+from models import ApiKey, Customer
+from tests.conftest import add_business, add_interactions
+
+
+def bearer(key):
+    return {'Authorization': f'Bearer {key}'}
+
+
+def new_key(client):
+    response = client.post('/dashboard/api-keys')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-store'
+    return response.get_data(as_text=True).splitlines()[0]
+
+
+def test_new_key_is_shown_once_and_not_kept_in_the_session(app, client, business):
+    key = new_key(client)
+    with client.session_transaction() as session:
+        assert key not in repr(dict(session))
+    with app.app_context():
+        assert db.session.query(ApiKey).filter_by(key_hash=ApiKey.hash_key(key), business_id=business).count() == 1
+    assert key not in client.get('/dashboard/profile').get_data(as_text=True)
+
+
+def test_revoked_key_stops_working(app, client, business):
+    key = new_key(client)
+    payload = {'interactions': [{'type': 'call', 'customer': {'name': 'Ann'}}]}
+    assert client.post('/api/ingest', json=payload, headers=bearer(key)).status_code == 201
+
+    with app.app_context():
+        key_id = db.session.query(ApiKey.id).filter_by(business_id=business).scalar()
+        other = add_business('other@example.com')
+        other_key = ApiKey(business_id=other)
+        other_key.set_key()
+        db.session.add(other_key)
+        db.session.commit()
+        other_key_id = other_key.id
+
+    client.post(f'/dashboard/api-keys/{other_key_id}/revoke')
+    client.post(f'/dashboard/api-keys/{key_id}/revoke')
+    assert client.post('/api/ingest', json=payload, headers=bearer(key)).status_code == 401
+    with app.app_context():
+        assert db.session.get(ApiKey, other_key_id) is not None
+
+
+def test_ingest_only_matches_the_business_own_customers(app, client, business):
+    with app.app_context():
+        add_interactions(business, 1)
+        other = add_business('other@example.com')
+        other_key = ApiKey(business_id=other)
+        key = other_key.set_key()
+        db.session.add(other_key)
+        db.session.commit()
+
+    email = f'customer0.{business}@example.com'
+    payload = {'interactions': [{'type': 'call', 'customer': {'name': 'Same', 'email': email}}]}
+    response = client.post('/api/ingest', json=payload, headers=bearer(key))
+    assert response.get_json()['customers_created'] == 1
+    with app.app_context():
+        assert [c.is_new for c in db.session.query(Customer).filter_by(email=email)] == [True, True]
+
+    # The same customer ingested again is now a returning customer of this business
+    response = client.post('/api/ingest', json=payload, headers=bearer(key))
+    assert response.get_json()['customers_created'] == 0
+
+
+def test_ingest_rejects_bad_durations(client):
+    key = new_key(client)
+    for duration in (True, -5, '60'):
+        payload = {'interactions': [{'type': 'call', 'customer': {'name': 'Ann'}, 'duration': duration}]}
+        response = client.post('/api/ingest', json=payload, headers=bearer(key))
+        assert response.status_code == 400
+        assert 'duration' in response.get_json()['error']
+
+
+def test_ingest_explains_bad_strings(client):
+    key = new_key(client)
+    for customer, messages, error in [
+        ({'name': 'Ann'}, [{'sender_type': 'customer', 'content': 42}], 'interactions[0].messages[0].content must be a string'),
+        ({'name': 'A' * 101}, [], 'interactions[0].customer.name must be at most 100 characters'),
+    ]:
+        payload = {'interactions': [{'type': 'chat', 'customer': customer, 'messages': messages}]}
+        response = client.post('/api/ingest', json=payload, headers=bearer(key))
+        assert response.status_code == 400
+        assert response.get_json()['error'] == error
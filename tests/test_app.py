@@ -0,0 +1,27 @@
+from flask import url_for
+
+from app import create_app, db
+from models import BookingVersion
+from tests.conftest import add_bookings
+
+
+def test_views_are_in_the_blueprint_and_old_endpoint_names_still_build(app):
+    assert 'main.dashboard' in app.view_functions
+    with app.test_request_context():
+        assert url_for('main.dashboard') == url_for('dashboard') == '/dashboard'
+        assert url_for('interaction_detail', interaction_id=3, _anchor='end') == '/dashboard/interaction/3#end'
+
+
+def test_listeners_run_once_however_many_apps_exist(app, business, tmp_path):
+    create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'other.db'}", 'PASSWORD_WORKERS': 0})
+    with app.app_context():
+        add_bookings(business, 1)
+        assert db.session.get(BookingVersion, business).version == 1
+
+
+def test_in_memory_sqlite_keeps_its_default_pool():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'PASSWORD_WORKERS': 0})
+    assert 'pool_size' not in app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    with app.app_context():
+        db.create_all()
+        assert db.session.get(BookingVersion, 1) is None
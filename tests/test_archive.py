@@ -0,0 +1,63 @@
+import os
+from datetime import datetime
+
+from app import db
+from archive import archive_interactions, load_archived
+from commands import archive_interactions_command
+from models import Interaction
+from rollups import rebuild_rollups
+from tests.conftest import add_interactions
+from utils import get_interaction_stats
+
+LONG_AGO = datetime(2020, 1, 10)
+
+
+def stats(app, business_id, use_rollups):
+    app.config['STATS_USE_ROLLUPS'] = use_rollups
+    with app.app_context():
+        result = get_interaction_stats.uncached(business_id)
+    return result['total'], {row['type']: row['count'] for row in result['types_data']}
+
+
+def test_archived_interactions_still_count(app, business):
+    with app.app_context():
+        old = add_interactions(business, 3, messages=2, start=LONG_AGO)
+        add_interactions(business, 2)
+        assert list(archive_interactions(datetime(2021, 1, 1))) == [3]
+        assert db.session.get(Interaction, old[0]) is None
+        interaction, messages = load_archived(business, old[0])
+        assert [m.content for m in messages] == ['Message 0 of conversation 0', 'Message 1 of conversation 0']
+
+    assert stats(app, business, use_rollups=False) == (5, {'Chat': 5, 'Call': 0, 'Message': 0})
+    assert stats(app, business, use_rollups=True) == (5, {'Chat': 5, 'Call': 0, 'Message': 0})
+
+    with app.app_context():
+        rebuild_rollups([business])
+        db.session.commit()
+    assert stats(app, business, use_rollups=True) == (5, {'Chat': 5, 'Call': 0, 'Message': 0})
+
+
+def test_archiving_needs_an_absolute_archive_dir(app, business):
+    with app.app_context():
+        add_interactions(business, 1, start=LONG_AGO)
+    runner = app.test_cli_runner()
+    for archive_dir in (None, 'archive'):
+        app.config['ARCHIVE_DIR'] = archive_dir
+        result = runner.invoke(archive_interactions_command)
+        assert result.exit_code != 0
+        assert 'ARCHIVE_DIR' in result.output
+    with app.app_context():
+        assert db.session.query(Interaction).count() == 1
+
+
+def test_unreadable_archive_is_unavailable_not_a_server_error(app, client, business):
+    with app.app_context():
+        interaction_id, = add_interactions(business, 1, messages=1, start=LONG_AGO)
+        list(archive_interactions(datetime(2021, 1, 1)))
+    url = f'/dashboard/interaction/{interaction_id}'
+    assert client.get(url).status_code == 200
+
+    os.remove(os.path.join(app.config['ARCHIVE_DIR'], str(business), '2020-01.jsonl.gz'))
+    assert client.get(url).status_code == 503
+    app.config['ARCHIVE_DIR'] = None
+    assert client.get(url).status_code == 503
@@ -0,0 +1,108 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from availability import BookingIndex, availability
+from models import ApiKey, Booking, Customer
+
+TOMORROW = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+def at(hour, minute=0):
+    return TOMORROW + timedelta(hours=hour, minutes=minute)
+
+
+@pytest.fixture
+def api(app, business):
+    """GET an availability endpoint with an API key of `business`"""
+    # The indexes outlive the test's database, whose business ids repeat
+    availability.clear()
+    with app.app_context():
+        api_key = ApiKey(business_id=business)
+        key = api_key.set_key()
+        db.session.add(api_key)
+        db.session.commit()
+    client = app.test_client()
+
+    def get(path, **args):
+        args = {name: value.isoformat() if isinstance(value, datetime) else value for name, value in args.items()}
+        response = client.get(f'/api/availability{path}', query_string=args, headers={'Authorization': f'Bearer {key}'})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return response.json
+
+    return get
+
+
+def add_booking(business_id, start, duration, status='scheduled'):
+    booking = Booking(business_id=business_id, customer=Customer(name='Booker'), service='Checkup',
+                      booking_time=start, duration=duration, status=status)
+    db.session.add(booking)
+    db.session.commit()
+    return booking.id
+
+
+def free(api, start, end, duration=30):
+    return [
+        (slot['start'], slot['end'])
+        for slot in api('', start=start, end=end, duration=duration)['free']
+    ]
+
+
+def test_free_slots_and_conflicts_skip_cancelled_bookings(app, business, api):
+    with app.app_context():
+        first = add_booking(business, at(9), 60)
+        add_booking(business, at(10), 60, status='cancelled')
+        default = add_booking(business, at(11), None)  # holds the default 30 minutes
+
+    assert free(api, at(9), at(12)) == [
+        (at(10).isoformat(), at(11).isoformat()),
+        (at(11, 30).isoformat(), at(12).isoformat()),
+    ]
+    assert free(api, at(9), at(12), duration=90) == []
+    assert api('/conflicts', start=at(9, 30), duration=60)['conflicts'] == [first]
+    assert api('/conflicts', start=at(10), duration=60) == {'available': True, 'conflicts': []}
+    assert api('/conflicts', start=at(10, 45), duration=30)['conflicts'] == [default]
+
+
+def test_commits_patch_the_index_in_place(app, business, api, monkeypatch):
+    with app.app_context():
+        first = add_booking(business, at(9), 60)
+        second = add_booking(business, at(13), 60)
+    assert free(api, at(9), at(14)) == [(at(10).isoformat(), at(13).isoformat())]
+
+    index = availability._indexes[business]
+    monkeypatch.setattr(availability, '_build', lambda *args: pytest.fail('index rebuilt'))
+    with app.app_context():
+        third = add_booking(business, at(11), 30)
+        db.session.get(Booking, first).status = 'cancelled'
+        db.session.get(Booking, second).booking_time = at(12)
+        db.session.commit()
+
+    assert free(api, at(9), at(14)) == [
+        (at(9).isoformat(), at(11).isoformat()),
+        (at(11, 30).isoformat(), at(12).isoformat()),
+        (at(13).isoformat(), at(14).isoformat()),
+    ]
+    assert api('/conflicts', start=at(11), duration=90)['conflicts'] == [third, second]
+    assert availability._indexes[business] is index
+
+
+def test_overlapping_matches_a_scan_of_every_booking():
+    rng = random.Random(0)
+    since = datetime(2026, 1, 1)
+    rows = [
+        (booking_id, since + timedelta(minutes=rng.randrange(0, 7 * 24 * 60, 15)), rng.choice([None, 15, 30, 90, 480]))
+        for booking_id in range(300)
+    ]
+    index = BookingIndex(1, since, rows)
+    for _ in range(500):
+        start = since + timedelta(minutes=rng.randrange(-60, 7 * 24 * 60))
+        end = start + timedelta(minutes=rng.randrange(1, 600))
+        expected = sorted(
+            (booking_time, booking_time + timedelta(minutes=duration or 30), booking_id)
+            for booking_id, booking_time, duration in rows
+            if booking_time < end and booking_time + timedelta(minutes=duration or 30) > start
+        )
+        assert index.overlapping(start, end) == expected
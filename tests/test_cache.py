@@ -0,0 +1,42 @@
+import pytest
+
+from app import db
+from cache import DictClient, LocalBackend, SharedBackend, StatsCache
+from models import Interaction
+from tests.conftest import add_business, add_interactions
+from utils import get_interaction_stats
+
+
+def test_moving_an_interaction_refreshes_both_businesses(app, business):
+    app.config['STATS_USE_ROLLUPS'] = False
+    with app.app_context():
+        other = add_business('other@example.com')
+        interaction_id, = add_interactions(business, 1)
+        assert get_interaction_stats(business)['total'] == 1
+        assert get_interaction_stats(other)['total'] == 0
+
+        db.session.get(Interaction, interaction_id).business_id = other
+        db.session.commit()
+
+        assert get_interaction_stats(business)['total'] == 0
+        assert get_interaction_stats(other)['total'] == 1
+
+
+def test_cache_counters_are_not_exposed_to_tenants(client):
+    assert client.get('/api/cache/stats').status_code == 404
+
+
+@pytest.mark.parametrize('backend', [LocalBackend(), SharedBackend(DictClient())], ids=['local', 'shared'])
+def test_invalidation_during_a_computation_is_not_lost(backend):
+    cache = StatsCache(backend)
+    results = iter(['stale', 'fresh'])
+
+    @cache.cached
+    def stats(business_id):
+        value = next(results)
+        if value == 'stale':
+            cache.invalidate(business_id)  # a commit lands while the stats are computed
+        return value
+
+    assert stats(1) == 'stale'
+    assert stats(1) == 'fresh'
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import routes
+from app import db
+from chatmodel import FakeChatModel
+from models import Business, Customer, Interaction
+from tests.conftest import add_business
+from writebehind import QueueFull
+
+
+class RecordingWriter:
+    def __init__(self, full_after=None):
+        self.messages = []
+        self.full_after = full_after
+
+    def enqueue_message(self, interaction_id, sender_type, content, timestamp=None):
+        if self.full_after is not None and len(self.messages) >= self.full_after:
+            raise QueueFull("full")
+        self.messages.append((sender_type, content))
+
+
+class FailingModel(FakeChatModel):
+    def stream_reply(self, messages):
+        yield 'Partial'
+        raise RuntimeError("model went away")
+
+
+def events(response):
+    return [
+        (frame.split('\n')[0][len('event: '):] if frame.startswith('event: ') else 'token',
+         json.loads(frame.rsplit('data: ', 1)[1]))
+        for frame in response.get_data(as_text=True).strip().split('\n\n')
+    ]
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    writer = RecordingWriter()
+    monkeypatch.setattr(routes, 'message_writer', writer)
+    return writer
+
+
+def stream(app, client, model=None):
+    if model is not None:
+        app.extensions['chat_model'] = model
+    app.config['CHAT_MODEL_BACKEND'] = 'fake'
+    return events(client.post('/dashboard/chatbot/stream', data={'message': 'Hello there'}))
+
+
+def test_complete_reply_is_saved(app, client, writer):
+    sent = stream(app, client)
+    assert sent[0][0] == 'start' and sent[-1][0] == 'done'
+    assert [sender for sender, _ in writer.messages] == ['customer', 'bot']
+    assert writer.messages[1][1] == ''.join(data['token'] for kind, data in sent if kind == 'token')
+
+
+def test_failed_reply_is_not_saved_and_not_done(app, client, writer):
+    sent = stream(app, client, FailingModel())
+    assert [kind for kind, _ in sent] == ['start', 'token', 'error']
+    assert writer.messages == [('customer', 'Hello there')]
+
+
+def test_full_buffer_ends_the_stream_with_an_error(app, client, monkeypatch):
+    monkeypatch.setattr(routes, 'message_writer', RecordingWriter(full_after=1))
+    sent = stream(app, client)
+    assert sent[-1][0] == 'error'
+    assert 'done' not in [kind for kind, _ in sent]
+
+
+def test_missing_api_key_is_an_error_not_a_canned_reply(app, client, writer, monkeypatch):
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    app.config['CHAT_MODEL_BACKEND'] = None
+    sent = events(client.post('/dashboard/chatbot/stream', data={'message': 'Hello there'}))
+    assert [kind for kind, _ in sent] == ['error']
+    assert writer.messages == []
+
+
+def test_new_chat_never_reuses_another_business_customer(app, client, business, writer):
+    with app.app_context():
+        other = add_business('other@example.com')
+        owner = db.session.get(Business, business)
+        stranger = Customer(name='Someone else', email=owner.email)
+        db.session.add(Interaction(business_id=other, customer=stranger, interaction_type='chat'))
+        db.session.commit()
+        stranger_id = stranger.id
+
+    sent = stream(app, client)
+    with app.app_context():
+        interaction = db.session.get(Interaction, sent[0][1]['interaction_id'])
+        assert interaction.customer_id != stranger_id
+        first_customer = interaction.customer_id
+
+    sent = stream(app, client)
+    with app.app_context():
+        assert db.session.get(Interaction, sent[0][1]['interaction_id']).customer_id == first_customer
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from sqlalchemy import inspect
+
+from app import db
+from chatcontext import ContextBuilder
+from chatmodel import FakeChatModel
+from models import Interaction, SummaryCheckpoint
+from tests.conftest import add_interactions
+
+
+class SlowSummaries(FakeChatModel):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def complete(self, messages):
+        self.release.wait(5)
+        return 'Rolling summary'
+
+
+def conversation(business, messages=45):
+    interaction_id, = add_interactions(business, 1, messages=messages)
+    db.session.get(Interaction, interaction_id).summary = 'Written by staff'
+    db.session.commit()
+    return interaction_id
+
+
+def wait_for_checkpoint(interaction_id):
+    for _ in range(100):
+        checkpoint = db.session.get(SummaryCheckpoint, interaction_id)
+        if checkpoint is not None:
+            return checkpoint
+        db.session.rollback()
+        time.sleep(0.05)
+
+
+def test_summary_is_folded_after_the_prompt_is_returned(app, business):
+    model = SlowSummaries()
+    builder = ContextBuilder(model, recent_messages=20, summarize_every=20, workers=1)
+    with app.test_request_context():
+        interaction_id = conversation(business)
+        started = time.monotonic()
+        prompt = builder.build(interaction_id, 'System', 'Next question')
+        assert time.monotonic() - started < 1
+        assert not any('Summary of the earlier' in message['content'] for message in prompt)
+
+        model.release.set()
+        checkpoint = wait_for_checkpoint(interaction_id)
+        assert checkpoint.summary == 'Rolling summary'
+        assert db.session.get(Interaction, interaction_id).summary == 'Written by staff'
+
+        prompt = builder.build(interaction_id, 'System', 'Another question')
+        assert prompt[1]['content'] == 'Summary of the earlier conversation: Rolling summary'
+
+
+def test_failed_fold_leaves_the_request_session_alone(app, business):
+    builder = ContextBuilder(FakeChatModel(), recent_messages=20, summarize_every=20, workers=0)
+    with app.test_request_context():
+        interaction_id = conversation(business)
+        db.session.add(SummaryCheckpoint(interaction_id=interaction_id, through_message_id=0, summary='Elsewhere'))
+        db.session.commit()
+        builder.invalidate(interaction_id)
+        # Another process moves the checkpoint on after this one has read it
+        builder._state(interaction_id)
+        db.session.query(SummaryCheckpoint).update({'through_message_id': 1})
+        db.session.commit()
+
+        interaction = db.session.get(Interaction, interaction_id)
+        builder.build(interaction_id, 'System', 'Next question')
+        # A rollback of the request's session would have expired what it loaded
+        assert 'summary' in inspect(interaction).dict
+        assert db.session.get(SummaryCheckpoint, interaction_id).summary == 'Elsewhere'
+
+
+class CountingSummaries(FakeChatModel):
+    calls = 0
+
+    def complete(self, messages):
+        self.calls += 1
+        return 'Rolling summary'
+
+
+def test_cold_start_reads_one_window_and_folds_once(app, business):
+    model = CountingSummaries()
+    builder = ContextBuilder(model, recent_messages=20, summarize_every=20, workers=0)
+    with app.test_request_context():
+        interaction_id = conversation(business, messages=200)
+        builder.build(interaction_id, 'System', 'Next question')
+
+        assert model.calls == 1
+        state = builder._state(interaction_id)
+        assert len(state.recent) == 20
+        checkpoint = db.session.get(SummaryCheckpoint, interaction_id)
+        assert checkpoint.through_message_id == state.recent[0]['id'] - 1
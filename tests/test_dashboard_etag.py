@@ -0,0 +1,39 @@
+from app import db
+from models import Interaction
+from tests.conftest import add_interactions
+from writebehind import MessageWriter
+
+
+def refresh(client, etag):
+    return client.get('/api/dashboard', headers={'If-None-Match': f'"{etag}"'})
+
+
+def test_unchanged_dashboard_is_not_modified_until_the_data_changes(app, client, business):
+    with app.app_context():
+        interaction_id, = add_interactions(business, 1)
+    response = client.get('/api/dashboard')
+    assert response.status_code == 200
+    etag = response.get_etag()[0]
+    assert refresh(client, etag).status_code == 304
+
+    with app.app_context():
+        add_interactions(business, 1)
+    response = refresh(client, etag)
+    assert response.status_code == 200
+    assert response.json['interaction_stats']['total'] == 2
+    etag = response.get_etag()[0]
+    assert refresh(client, etag).status_code == 304
+
+    # The flusher only writes messages and end times with Core statements
+    writer = MessageWriter(flush_interval=3600)
+    writer.app = app
+    try:
+        writer.enqueue_message(interaction_id, 'customer', 'One more thing')
+        assert writer.flush() == 1
+    finally:
+        writer.stop()
+    with app.app_context():
+        assert db.session.get(Interaction, interaction_id).end_time is not None
+    response = refresh(client, etag)
+    assert response.status_code == 200
+    assert refresh(client, response.get_etag()[0]).status_code == 304
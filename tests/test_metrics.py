@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from metrics import pool_checkout_wait, request_sql_statements
+
+
+def test_failed_statements_do_not_leak_query_timers(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(Exception):
+                    connection.execute(text('SELECT * FROM no_such_table'))
+            connection.execute(text('SELECT 1'))
+            assert connection.info['query_start_time'] == {}
+
+
+def test_metrics_need_a_token_or_a_local_client(app):
+    client = app.test_client()
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code == 403
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code == 200
+
+    app.config['METRICS_TOKEN'] = 'secret'
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'},
+                          environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds' in response.get_data(as_text=True)
+
+
+def test_pool_checkout_wait_is_labelled_by_pool(app, client):
+    before = pool_checkout_wait._series.get('primary', {}).get('count', 0)
+    assert client.get('/dashboard/interactions').status_code == 200
+    assert pool_checkout_wait._series['primary']['count'] > before
+
+
+def test_stats_workers_statements_count_towards_the_request(app, client):
+    def statements(workers):
+        app.config['STATS_WORKERS'] = workers
+        before = request_sql_statements._series.get('main.api_dashboard', {}).get('sum', 0)
+        assert client.get('/api/dashboard').status_code == 200
+        return request_sql_statements._series['main.api_dashboard']['sum'] - before
+
+    client.get('/api/dashboard')  # warm the logged-in business cache
+    assert statements(3) == statements(0)
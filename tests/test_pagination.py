@@ -0,0 +1,33 @@
+from app import db
+from models import Interaction
+from tests.conftest import add_interactions
+
+
+def pages(client, url):
+    ids, cursor = [], None
+    while True:
+        response = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200, response.get_data(as_text=True)
+        body = response.get_json()
+        ids += [item['id'] for item in body['items']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            return ids
+
+
+def test_paging_reaches_rows_without_a_start_time(app, client, business):
+    with app.app_context():
+        ids = add_interactions(business, 7)
+        for interaction_id in (ids[1], ids[4]):
+            db.session.get(Interaction, interaction_id).start_time = None
+        db.session.commit()
+
+    for per_page in (1, 2, 3):
+        seen = pages(client, f'/api/interactions?per_page={per_page}')
+        assert seen[:2] == [ids[4], ids[1]]
+        assert sorted(seen) == sorted(ids)
+        assert len(seen) == len(ids)
+
+
+def test_malformed_cursor_is_rejected(client):
+    assert client.get('/api/interactions?cursor=bm9wZQ').status_code == 400
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+from flask import request
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import create_app, db
+from models import Business
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+def slow_hash(seconds):
+    time.sleep(seconds)
+    return 'done'
+
+
+def test_abandoned_jobs_keep_their_slot_until_they_finish():
+    hasher = PasswordHasher(workers=1, max_pending=1, timeout=0.1)
+    try:
+        with pytest.raises(PasswordHasherBusy, match='longer than'):
+            hasher._run(slow_hash, 1)
+        # The first job still occupies the only worker, so there is no room for another
+        with pytest.raises(PasswordHasherBusy, match='already pending'):
+            hasher._run(slow_hash, 0)
+        # Once it finishes its slot is free again
+        hasher.timeout = 10
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                assert hasher._run(slow_hash, 0) == 'done'
+                break
+            except PasswordHasherBusy:
+                assert time.monotonic() < deadline
+                time.sleep(0.1)
+    finally:
+        hasher.shutdown()
+
+
+def client_address(app):
+    app.add_url_rule('/whoami', 'whoami', lambda: request.remote_addr)
+    response = app.test_client().get(
+        '/whoami', headers={'X-Forwarded-For': '198.51.100.1'}, environ_base={'REMOTE_ADDR': '203.0.113.7'}
+    )
+    return response.get_data(as_text=True)
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(app):
+    assert client_address(app) == '203.0.113.7'
+
+
+def test_forwarded_for_is_used_behind_a_trusted_proxy(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'proxied.db'}", 'TRUSTED_PROXIES': 1})
+    assert client_address(app) == '198.51.100.1'
+
+
+def log_in(client, password, email='clinic@example.com'):
+    return client.post('/login', data={'email': email, 'password': password})
+
+
+def test_login_attempts_are_refused_once_the_bucket_is_empty(app, business):
+    app.config['LOGIN_ATTEMPTS_BURST'] = 3
+    client = app.test_client()
+    for _ in range(3):
+        assert log_in(client, 'wrong').status_code == 200
+    response = log_in(client, 'password123')
+    assert response.status_code == 429
+    assert 'Too many login attempts' in response.get_data(as_text=True)
+
+
+def test_login_rehashes_a_password_hashed_with_old_parameters(app, business):
+    with app.app_context():
+        db.session.get(Business, business).password_hash = generate_password_hash('password123', 'pbkdf2:sha256:500')
+        db.session.commit()
+
+    assert log_in(app.test_client(), 'password123').status_code == 302
+    with app.app_context():
+        password_hash = db.session.get(Business, business).password_hash
+        assert password_hash.startswith('pbkdf2:sha256:1000$')
+        assert check_password_hash(password_hash, 'password123')
@@ -0,0 +1,45 @@
+import pytest
+
+from app import db
+from querycount import QueryCounter
+from tests.conftest import add_bookings, add_interactions
+
+ROWS = 30
+
+
+def statements_for(app, client, url):
+    with app.app_context():
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return counter.count, response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('url, setup, name', [
+    ('/dashboard/interactions', add_interactions, 'Customer'),
+    ('/dashboard/bookings', add_bookings, 'Booker'),
+])
+def test_listing_statement_count_does_not_grow_with_rows(app, client, business, url, setup, name):
+    with app.app_context():
+        setup(business, ROWS)
+    client.get(url)  # warm the logged-in business cache
+
+    one, page = statements_for(app, client, f'{url}?per_page=1')
+    many, page = statements_for(app, client, f'{url}?per_page={ROWS}')
+
+    # The page really shows every row's customer, so lazy loads would add a statement per row
+    assert page.count(name) == ROWS
+    assert many == one
+
+
+def test_search_statement_count_does_not_grow_with_hits(app, client, business):
+    with app.app_context():
+        add_interactions(business, ROWS, messages=1)
+    client.get('/api/search?q=conversation')
+
+    one, _ = statements_for(app, client, '/api/search?q=conversation&per_page=1')
+    many, body = statements_for(app, client, f'/api/search?q=conversation&per_page={ROWS}')
+
+    assert body.count('customer_name') == ROWS
+    assert many == one
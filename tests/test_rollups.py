@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from app import db
+from models import Booking, Customer, Interaction
+from rollups import rebuild_rollups
+from tests.conftest import add_bookings, add_interactions
+from utils import get_booking_stats, get_interaction_stats
+
+
+def both_paths(app, stats_function, business_id):
+    results = []
+    for use_rollups in (False, True):
+        app.config['STATS_USE_ROLLUPS'] = use_rollups
+        results.append(stats_function.uncached(business_id))
+    return results
+
+
+def test_rollups_count_rows_without_a_time_or_status(app, business):
+    with app.app_context():
+        add_interactions(business, 5)
+        add_bookings(business, 3)
+        customer = Customer(name='Undated')
+        interaction = Interaction(business_id=business, customer=customer, interaction_type='chat')
+        booking = Booking(business_id=business, customer=customer, service='Checkup',
+                          booking_time=datetime.utcnow(), duration=30)
+        db.session.add_all([interaction, booking])
+        db.session.commit()
+        # The columns' defaults fill them in on insert, but they can be cleared later
+        interaction.start_time = None
+        booking.status = None
+        db.session.commit()
+
+        raw, rolled_up = both_paths(app, get_interaction_stats, business)
+        assert raw['total'] == 6
+        assert rolled_up == raw
+        raw, rolled_up = both_paths(app, get_booking_stats, business)
+        assert rolled_up == raw
+
+        rebuild_rollups([business])
+        db.session.commit()
+        assert both_paths(app, get_interaction_stats, business)[1]['total'] == 6
+        raw, rolled_up = both_paths(app, get_booking_stats, business)
+        assert rolled_up == raw
@@ -0,0 +1,39 @@
+from app import db
+from commands import create_indexes
+from models import Interaction
+from tests.conftest import add_interactions
+
+
+def test_terms_only_match_the_text(app, client, business):
+    with app.app_context():
+        ids = add_interactions(business, 3, messages=1)
+        db.session.get(Interaction, ids[0]).summary = f'Asked about b{business} vitamins'
+        db.session.commit()
+
+    hits = client.get(f'/api/search?q=b{business}').get_json()['items']
+    assert [(hit['kind'], hit['interaction']['id']) for hit in hits] == [('summary', ids[0])]
+
+    hits = client.get('/api/search?q=conversation 2').get_json()['items']
+    assert [hit['interaction']['id'] for hit in hits] == [ids[2]]
+
+
+def test_create_indexes_skips_other_databases_indexes(app):
+    with app.app_context():
+        db.session.execute(db.text('DROP INDEX ix_message_interaction_timestamp'))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(create_indexes)
+    assert result.exit_code == 0, result.output
+    assert 'Created ix_message_interaction_timestamp on message' in result.output
+    assert 'fts' not in result.output.replace('search', '')
+
+
+def test_better_matches_rank_higher_and_come_first(app, client, business):
+    with app.app_context():
+        ids = add_interactions(business, 2)
+        db.session.get(Interaction, ids[0]).summary = 'Asked about vitamins and a refund'
+        db.session.get(Interaction, ids[1]).summary = 'Vitamins, vitamins, vitamins'
+        db.session.commit()
+
+    hits = client.get('/api/search?q=vitamins').get_json()['items']
+    assert [hit['interaction']['id'] for hit in hits] == [ids[1], ids[0]]
+    assert hits[0]['rank'] > hits[1]['rank']
@@ -0,0 +1,130 @@
+from datetime import datetime
+
+import pytest
+
+import utils
+from app import db
+from models import Booking, Customer, Interaction
+from tests.conftest import add_business
+from utils import get_booking_stats, get_customer_stats, get_interaction_stats
+
+# A Wednesday: the week starts on Monday the 13th, the month on the 1st
+NOW = datetime(2026, 4, 15, 10, 0)
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def utcnow(cls):
+        return NOW
+
+
+@pytest.fixture(params=[False, True], ids=['raw', 'rollups'])
+def frozen(app, monkeypatch, request):
+    monkeypatch.setattr(utils, 'datetime', FrozenDatetime)
+    app.config['STATS_USE_ROLLUPS'] = request.param
+
+
+def test_interaction_stats_around_day_week_and_month_boundaries(app, business, frozen):
+    customer = Customer(name='Customer')
+    with app.app_context():
+        db.session.add_all(
+            Interaction(business_id=business, customer=customer, interaction_type=kind, start_time=start)
+            for kind, start in [
+                ('chat', datetime(2026, 4, 15, 12, 0)),      # later today
+                ('chat', datetime(2026, 4, 15, 0, 0)),       # today's first second
+                ('call', datetime(2026, 4, 14, 23, 59, 59)),
+                ('message', datetime(2026, 4, 13, 0, 0)),    # start of the week
+                ('chat', datetime(2026, 4, 12, 23, 59, 59)),
+                ('chat', datetime(2026, 4, 9, 0, 0)),        # oldest day of the chart
+                ('message', datetime(2026, 4, 8, 23, 59, 59)),
+                ('chat', datetime(2026, 4, 1, 0, 0)),        # start of the month
+                ('call', datetime(2026, 3, 31, 23, 59, 59)),
+            ]
+        )
+        db.session.commit()
+
+        assert get_interaction_stats.uncached(business) == {
+            'today': 2,
+            'week': 4,
+            'month': 8,
+            'total': 9,
+            'daily_data': [
+                {'day': name, 'count': count}
+                for name, count in zip(['Thu', 'Fri', 'Sat', 'Sun', 'Mon', 'Tue', 'Wed'], [1, 0, 0, 1, 1, 1, 2])
+            ],
+            'types_data': [
+                {'type': 'Chat', 'count': 5},
+                {'type': 'Call', 'count': 2},
+                {'type': 'Message', 'count': 2},
+            ],
+        }
+
+
+def test_booking_stats_around_day_and_week_boundaries(app, business, frozen):
+    customer = Customer(name='Booker')
+    with app.app_context():
+        db.session.add_all(
+            Booking(business_id=business, customer=customer, service='Checkup', booking_time=time, duration=30,
+                    status=status)
+            for status, time in [
+                ('scheduled', datetime(2026, 4, 15, 9, 0)),     # earlier today
+                ('scheduled', datetime(2026, 4, 15, 10, 30)),   # later today
+                ('cancelled', datetime(2026, 4, 16, 0, 0)),
+                ('completed', datetime(2026, 4, 19, 23, 59, 59)),  # end of the week
+                ('scheduled', datetime(2026, 4, 20, 0, 0)),     # start of next week
+                ('scheduled', datetime(2026, 4, 21, 23, 59, 59)),  # last day of the chart
+                ('scheduled', datetime(2026, 4, 22, 0, 0)),
+                ('completed', datetime(2026, 4, 13, 0, 0)),     # start of the week
+                ('cancelled', datetime(2026, 4, 12, 23, 59, 59)),
+            ]
+        )
+        db.session.commit()
+
+        assert get_booking_stats.uncached(business) == {
+            'upcoming': 4,
+            'today': 2,
+            'week': 5,
+            'daily_data': [
+                {'day': name, 'count': count}
+                for name, count in zip(['Wed', 'Thu', 'Fri', 'Sat', 'Sun', 'Mon', 'Tue'], [2, 1, 0, 0, 1, 1, 1])
+            ],
+            'status_data': [
+                {'status': 'Scheduled', 'count': 5},
+                {'status': 'Completed', 'count': 2},
+                {'status': 'Cancelled', 'count': 2},
+            ],
+        }
+
+
+def test_customer_stats_count_each_customer_once(app, business):
+    with app.app_context():
+        other = add_business('other@example.com')
+        new, returning, unknown, both = (
+            Customer(name='New', is_new=True),
+            Customer(name='Returning', is_new=False),
+            Customer(name='Unknown'),
+            Customer(name='Both', is_new=True),
+        )
+        db.session.add_all([
+            Interaction(business_id=business, customer=new, interaction_type='chat'),
+            Booking(business_id=business, customer=returning, service='Checkup', booking_time=NOW, duration=30),
+            Interaction(business_id=business, customer=unknown, interaction_type='call'),
+            Booking(business_id=business, customer=unknown, service='Checkup', booking_time=NOW, duration=30),
+            Interaction(business_id=business, customer=both, interaction_type='chat'),
+            Booking(business_id=business, customer=both, service='Checkup', booking_time=NOW, duration=30),
+            Interaction(business_id=other, customer=Customer(name='Elsewhere', is_new=True), interaction_type='chat'),
+        ])
+        db.session.commit()
+        unknown.is_new = None  # the column default fills it in on insert
+        db.session.commit()
+
+        # A NULL is_new counts as returning, as total minus new always has
+        assert get_customer_stats.uncached(business) == {
+            'total': 4,
+            'new': 2,
+            'returning': 2,
+            'type_data': [
+                {'type': 'New', 'count': 2},
+                {'type': 'Returning', 'count': 2},
+            ],
+        }
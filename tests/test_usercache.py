@@ -0,0 +1,21 @@
+from usercache import user_cache
+
+
+def cached_business(app, business_id):
+    with app.app_context():
+        return user_cache.load(business_id)
+
+
+def test_profile_and_password_changes_replace_the_cached_snapshot(app, client, business):
+    client.get('/dashboard/profile')  # caches the logged-in business
+    assert cached_business(app, business).business_name == 'clinic'
+
+    response = client.post('/dashboard/profile', data={'business_name': 'Renamed clinic', 'business_type': 'clinic'})
+    assert response.status_code == 302
+    assert cached_business(app, business).business_name == 'Renamed clinic'
+
+    response = client.post('/dashboard/change-password', data={
+        'current_password': 'password123', 'new_password': 'new password', 'confirm_password': 'new password'
+    })
+    assert response.status_code == 302
+    assert cached_business(app, business).check_password('new password')
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from app import db
+from models import Interaction, Message
+from tests.conftest import add_interactions
+from writebehind import MessageWriter
+
+
+def test_bad_message_does_not_block_the_rest(app, business):
+    with app.app_context():
+        good, bad = add_interactions(business, 2)
+    writer = MessageWriter(flush_interval=3600, max_attempts=2)
+    writer.app = app
+    sent_at = datetime.utcnow() + timedelta(days=1)
+    try:
+        for i in range(5):
+            writer.enqueue_message(good, 'customer', f'Hello {i}', sent_at + timedelta(seconds=i))
+        writer.enqueue_message(bad, 'customer', None)  # content is NOT NULL
+
+        assert writer.flush() == 5
+        assert writer.pending() == 1
+        assert writer.flush() == 0
+        assert writer.pending() == 0
+        assert writer.dropped == 1
+
+        writer.enqueue_message(good, 'bot', 'Still flowing')
+        assert writer.flush() == 1
+    finally:
+        writer.stop()
+
+    with app.app_context():
+        assert db.session.query(Message).filter_by(interaction_id=good).count() == 6
+        assert db.session.query(Message).filter_by(interaction_id=bad).count() == 0
+        assert db.session.get(Interaction, good).end_time >= sent_at + timedelta(seconds=4)
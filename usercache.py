@@ -0,0 +1,46 @@
+"""Short-lived cache of logged-in businesses for flask-login's user loader.
+
+Cached businesses are detached snapshots shared between requests: read them
+freely, but load the business into the session (db.session.get) before
+changing it, then call user_cache.invalidate(). The cache is per process,
+so other gunicorn workers may keep serving the old snapshot for up to
+USER_CACHE_TTL seconds.
+"""
+from app import db
+from cache import LocalBackend
+
+
+class UserCache:
+    def __init__(self, ttl=30, max_entries=1024):
+        self.backend = LocalBackend(max_entries, ttl)
+        self.enabled = ttl > 0
+
+    def init_app(self, app):
+        ttl = app.config.get('USER_CACHE_TTL', 30)
+        self.enabled = ttl > 0
+        self.backend = LocalBackend(app.config.get('USER_CACHE_SIZE', 1024), ttl)
+
+    def load(self, business_id):
+        """Return the business, from the cache when a fresh snapshot exists"""
+        from models import Business
+
+        if not self.enabled:
+            return db.session.get(Business, business_id)
+
+        generation = self.backend.generation(business_id)
+        found, business = self.backend.get(business_id, 'business', generation)
+        if found:
+            return business
+
+        business = db.session.get(Business, business_id)
+        if business is not None:
+            # Detach it so later commits in this session can't expire or change the shared copy
+            db.session.expunge(business)
+            self.backend.set(business_id, 'business', business, generation)
+        return business
+
+    def invalidate(self, business_id):
+        self.backend.invalidate(business_id)
+
+
+user_cache = UserCache()
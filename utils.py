@@ -1,177 +1,181 @@
+import base64
+import binascii
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from models import Interaction, Booking, Customer
+from flask import current_app, g
+from sqlalchemy import Date, and_, case, func, literal, or_, select, union, union_all
+from app import db
+from cache import stats_cache
+from models import Interaction, ArchivedInteraction, Booking, Customer, DailyInteractionRollup, DailyBookingRollup
+from replica import reads_from_replica
+from rollups import use_rollups
 
+INTERACTION_TYPES = [('chat', 'Chat'), ('call', 'Call'), ('message', 'Message')]
+BOOKING_STATUSES = [('scheduled', 'Scheduled'), ('completed', 'Completed'), ('cancelled', 'Cancelled')]
+
+def _count_if(condition, weight=1):
+    """Conditional COUNT (or SUM of weight) that works on both PostgreSQL and SQLite"""
+    return func.coalesce(func.sum(case((condition, weight), else_=0)), 0)
+
+def _bound(column, value):
+    """Compare Date columns (the rollups) against dates and DateTime columns against datetimes"""
+    return value.date() if isinstance(column.type, Date) else value
+
+def _day_start(dt):
+    """Truncate a datetime to midnight"""
+    return datetime(dt.year, dt.month, dt.day, 0, 0, 0)
+
+def day_buckets(first_day, days=7):
+    """Return (start, end) pairs for consecutive whole days beginning on first_day"""
+    first_day = _day_start(first_day)
+    return [
+        (first_day + timedelta(days=i), first_day + timedelta(days=i + 1))
+        for i in range(days)
+    ]
+
+def _count_in_buckets(column, buckets, weight=1):
+    """Conditional counts of column falling in each half-open (start, end) bucket"""
+    return [
+        _count_if((column >= _bound(column, start)) & (column < _bound(column, end)), weight)
+        for start, end in buckets
+    ]
+
+@stats_cache.cached
 def get_interaction_stats(business_id):
     """Get interaction statistics for a business"""
     now = datetime.utcnow()
-    today_start = datetime(now.year, now.month, now.day, 0, 0, 0)
-    week_start = now - timedelta(days=now.weekday())
-    week_start = datetime(week_start.year, week_start.month, week_start.day, 0, 0, 0)
+    today_start = _day_start(now)
+    week_start = _day_start(now - timedelta(days=now.weekday()))
     month_start = datetime(now.year, now.month, 1, 0, 0, 0)
     
-    # Get counts for different time periods
-    today_count = Interaction.query.filter(
-        Interaction.business_id == business_id,
-        Interaction.start_time >= today_start
-    ).count()
-    
-    week_count = Interaction.query.filter(
-        Interaction.business_id == business_id,
-        Interaction.start_time >= week_start
-    ).count()
-    
-    month_count = Interaction.query.filter(
-        Interaction.business_id == business_id,
-        Interaction.start_time >= month_start
-    ).count()
-    
-    total_count = Interaction.query.filter(
-        Interaction.business_id == business_id
-    ).count()
-    
-    # Get daily interactions for the last 7 days
-    daily_data = []
-    for i in range(6, -1, -1):
-        day = now - timedelta(days=i)
-        day_start = datetime(day.year, day.month, day.day, 0, 0, 0)
-        day_end = datetime(day.year, day.month, day.day, 23, 59, 59)
-        
-        count = Interaction.query.filter(
-            Interaction.business_id == business_id,
-            Interaction.start_time >= day_start,
-            Interaction.start_time <= day_end
-        ).count()
-        
-        daily_data.append({
-            'day': day.strftime('%a'),
-            'count': count
-        })
-    
-    # Get interaction types distribution
-    chat_count = Interaction.query.filter(
-        Interaction.business_id == business_id,
-        Interaction.interaction_type == 'chat'
-    ).count()
-    
-    call_count = Interaction.query.filter(
-        Interaction.business_id == business_id,
-        Interaction.interaction_type == 'call'
-    ).count()
-    
-    message_count = Interaction.query.filter(
-        Interaction.business_id == business_id,
-        Interaction.interaction_type == 'message'
-    ).count()
+    # Last 7 days, oldest first
+    days = day_buckets(now - timedelta(days=6))
+    
+    # The daily rollups hold one pre-counted row per day and type, so every
+    # figure below can be summed from them instead of counting raw rows
+    if use_rollups():
+        source, time_column, weight = DailyInteractionRollup, DailyInteractionRollup.day, DailyInteractionRollup.count
+        type_column = source.interaction_type
+        conditions = [source.business_id == business_id]
+    else:
+        # Archived interactions have left Interaction but still count
+        source = union_all(*(
+            select(model.interaction_type, model.start_time).where(model.business_id == business_id)
+            for model in (Interaction, ArchivedInteraction)
+        )).subquery()
+        time_column, type_column, weight, conditions = source.c.start_time, source.c.interaction_type, literal(1), []
+    
+    # Every count is a conditional aggregate over the business's rows, so the
+    # whole dashboard block is computed in a single round-trip
+    columns = [
+        _count_if(time_column >= _bound(time_column, today_start), weight),
+        _count_if(time_column >= _bound(time_column, week_start), weight),
+        _count_if(time_column >= _bound(time_column, month_start), weight),
+        func.coalesce(func.sum(weight), 0),
+    ]
+    columns += _count_in_buckets(time_column, days, weight)
+    columns += [
+        _count_if(type_column == interaction_type, weight)
+        for interaction_type, _ in INTERACTION_TYPES
+    ]
+    
+    row = db.session.query(*columns).select_from(source).filter(*conditions).one()
+    today_count, week_count, month_count, total_count = row[:4]
+    daily_counts = row[4:4 + len(days)]
+    type_counts = row[4 + len(days):]
     
     return {
         'today': today_count,
         'week': week_count,
         'month': month_count,
         'total': total_count,
-        'daily_data': daily_data,
+        'daily_data': [
+            {'day': day_start.strftime('%a'), 'count': count}
+            for (day_start, _), count in zip(days, daily_counts)
+        ],
         'types_data': [
-            {'type': 'Chat', 'count': chat_count},
-            {'type': 'Call', 'count': call_count},
-            {'type': 'Message', 'count': message_count}
+            {'type': label, 'count': count}
+            for (_, label), count in zip(INTERACTION_TYPES, type_counts)
         ]
     }
 
+@stats_cache.cached
 def get_booking_stats(business_id):
     """Get booking statistics for a business"""
     now = datetime.utcnow()
-    today_start = datetime(now.year, now.month, now.day, 0, 0, 0)
-    week_start = now - timedelta(days=now.weekday())
-    week_start = datetime(week_start.year, week_start.month, week_start.day, 0, 0, 0)
-    month_start = datetime(now.year, now.month, 1, 0, 0, 0)
+    today_start = _day_start(now)
+    week_start = _day_start(now - timedelta(days=now.weekday()))
+    
+    # Next 7 days, starting today
+    days = day_buckets(now)
+    
+    tomorrow_start = today_start + timedelta(days=1)
+    if use_rollups():
+        source, time_column, weight = DailyBookingRollup, DailyBookingRollup.day, DailyBookingRollup.count
+        # Upcoming bookings from tomorrow on; the rest of today is counted below
+        upcoming = (time_column >= tomorrow_start.date()) & (source.status == 'scheduled')
+    else:
+        source, time_column, weight = Booking, Booking.booking_time, literal(1)
+        upcoming = (time_column > now) & (source.status == 'scheduled')
     
-    # Upcoming bookings
-    upcoming_bookings = Booking.query.filter(
-        Booking.business_id == business_id,
-        Booking.booking_time > now,
-        Booking.status == 'scheduled'
-    ).count()
-    
-    # Today's bookings
-    today_bookings = Booking.query.filter(
-        Booking.business_id == business_id,
-        Booking.booking_time >= today_start,
-        Booking.booking_time < today_start + timedelta(days=1)
-    ).count()
-    
-    # This week's bookings
-    week_bookings = Booking.query.filter(
-        Booking.business_id == business_id,
-        Booking.booking_time >= week_start,
-        Booking.booking_time < week_start + timedelta(days=7)
-    ).count()
-    
-    # Get daily bookings for the next 7 days
-    daily_data = []
-    for i in range(0, 7):
-        day = now + timedelta(days=i)
-        day_start = datetime(day.year, day.month, day.day, 0, 0, 0)
-        day_end = datetime(day.year, day.month, day.day, 23, 59, 59)
-        
-        count = Booking.query.filter(
+    columns = [
+        # Upcoming bookings
+        _count_if(upcoming, weight),
+        # Today's and this week's bookings
+        *_count_in_buckets(time_column, [
+            (today_start, tomorrow_start),
+            (week_start, week_start + timedelta(days=7))
+        ], weight)
+    ]
+    columns += _count_in_buckets(time_column, days, weight)
+    columns += [_count_if(source.status == status, weight) for status, _ in BOOKING_STATUSES]
+    
+    row = db.session.query(*columns).filter(source.business_id == business_id).one()
+    upcoming_bookings, today_bookings, week_bookings = row[:3]
+    
+    if source is DailyBookingRollup:
+        # Rollups have day resolution, so count today's remaining bookings directly
+        upcoming_bookings += Booking.query.filter(
             Booking.business_id == business_id,
-            Booking.booking_time >= day_start,
-            Booking.booking_time <= day_end
+            Booking.booking_time > now,
+            Booking.booking_time < tomorrow_start,
+            Booking.status == 'scheduled'
         ).count()
-        
-        daily_data.append({
-            'day': day.strftime('%a'),
-            'count': count
-        })
-    
-    # Get booking status distribution
-    scheduled_count = Booking.query.filter(
-        Booking.business_id == business_id,
-        Booking.status == 'scheduled'
-    ).count()
-    
-    completed_count = Booking.query.filter(
-        Booking.business_id == business_id,
-        Booking.status == 'completed'
-    ).count()
-    
-    cancelled_count = Booking.query.filter(
-        Booking.business_id == business_id,
-        Booking.status == 'cancelled'
-    ).count()
+    daily_counts = row[3:3 + len(days)]
+    status_counts = row[3 + len(days):]
     
     return {
         'upcoming': upcoming_bookings,
         'today': today_bookings,
         'week': week_bookings,
-        'daily_data': daily_data,
+        'daily_data': [
+            {'day': day_start.strftime('%a'), 'count': count}
+            for (day_start, _), count in zip(days, daily_counts)
+        ],
         'status_data': [
-            {'status': 'Scheduled', 'count': scheduled_count},
-            {'status': 'Completed', 'count': completed_count},
-            {'status': 'Cancelled', 'count': cancelled_count}
+            {'status': label, 'count': count}
+            for (_, label), count in zip(BOOKING_STATUSES, status_counts)
         ]
     }
 
+@stats_cache.cached
 def get_customer_stats(business_id):
     """Get customer statistics for a business"""
-    # Get all customers who have interactions or bookings with this business
-    customer_ids = set()
-    
-    interactions = Interaction.query.filter_by(business_id=business_id).all()
-    for interaction in interactions:
-        customer_ids.add(interaction.customer_id)
-    
-    bookings = Booking.query.filter_by(business_id=business_id).all()
-    for booking in bookings:
-        customer_ids.add(booking.customer_id)
+    # Customers who have interactions (live or archived) or bookings with this business; UNION
+    # de-duplicates in the database so no rows are loaded into Python
+    customer_ids = union(
+        select(Interaction.customer_id).where(Interaction.business_id == business_id),
+        select(ArchivedInteraction.customer_id).where(ArchivedInteraction.business_id == business_id),
+        select(Booking.customer_id).where(Booking.business_id == business_id)
+    ).subquery()
     
-    # Count total unique customers
-    total_customers = len(customer_ids)
-    
-    # Count new vs returning customers
-    new_customers = Customer.query.filter(
-        Customer.id.in_(customer_ids),
-        Customer.is_new == True
-    ).count()
+    # Count total unique customers and new vs returning in the same statement
+    total_customers, new_customers = db.session.query(
+        func.count(Customer.id),
+        _count_if(Customer.is_new == True)
+    ).join(customer_ids, Customer.id == customer_ids.c.customer_id).one()
     
     returning_customers = total_customers - new_customers
     
@@ -185,6 +189,60 @@ def get_customer_stats(business_id):
         ]
     }
 
+# Per-request counters kept in g by the statement listeners
+STATEMENT_COUNTERS = ('sql_count', 'sql_time', 'query_count')
+
+_stats_executor = None
+_stats_executor_pid = None
+_stats_executor_lock = threading.Lock()
+
+def _executor(workers):
+    """Shared thread pool for stats queries, created lazily in each worker process"""
+    global _stats_executor, _stats_executor_pid
+    with _stats_executor_lock:
+        if _stats_executor is None or _stats_executor_pid != os.getpid():
+            _stats_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stats')
+            _stats_executor_pid = os.getpid()
+        return _stats_executor
+
+def gather_stats(business_id, cached=True):
+    """Return the interaction, booking and customer stats, computed concurrently
+
+    Each computation runs in its own app context and so on its own database
+    connection; the three queries overlap instead of running back to back.
+    Their SQL statement counts and time are added to the caller's request
+    metrics. STATS_WORKERS=0 computes them one after another in the calling
+    thread. With cached=False the stats cache is bypassed.
+    """
+    functions = (get_interaction_stats, get_booking_stats, get_customer_stats)
+    if not cached:
+        functions = tuple(stats_function.uncached for stats_function in functions)
+    workers = current_app.config.get('STATS_WORKERS', 6)
+    if not workers:
+        return tuple(stats_function(business_id) for stats_function in functions)
+
+    app = current_app._get_current_object()
+    # The workers' app contexts don't inherit g, so carry the replica routing
+    # over and hand the statement counters back (see metrics and querycount)
+    replica_reads = reads_from_replica()
+    counters = [name for name in STATEMENT_COUNTERS if name in g]
+
+    def run(stats_function):
+        with app.app_context():
+            g.replica_reads = replica_reads
+            for name in counters:
+                setattr(g, name, 0)
+            return stats_function(business_id), {name: getattr(g, name) for name in counters}
+
+    futures = [_executor(workers).submit(run, stats_function) for stats_function in functions]
+    results = []
+    for future in futures:
+        result, counted = future.result()
+        for name, value in counted.items():
+            setattr(g, name, getattr(g, name) + value)
+        results.append(result)
+    return tuple(results)
+
 def format_duration(seconds):
     """Format seconds into a human-readable duration"""
     if not seconds:
@@ -201,4 +259,49 @@ def format_duration(seconds):
     if seconds and not hours:
         result.append(f"{seconds}s")
     
-    return " ".join(result)
\ No newline at end of file
+    return " ".join(result)
+
+def encode_cursor(value, row_id):
+    """Encode a keyset position (value may be None) as an opaque URL-safe token"""
+    raw = f"{value.isoformat() if value is not None else ''}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a token from encode_cursor, raising ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, row_id = raw.split('|')
+        return datetime.fromisoformat(value) if value else None, int(row_id)
+    except (UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def paginate_keyset(query, column, id_column, cursor=None, per_page=50):
+    """Return one page of query ordered newest first, plus the cursor for the next page
+    
+    Pages are addressed by the (column, id) of the last row seen rather than an
+    OFFSET, so every page costs the same index range scan however deep it is.
+    Rows where column is NULL come first, as PostgreSQL orders a descending
+    index scan.
+    """
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        if value is None:
+            query = query.filter(or_(
+                column.isnot(None),
+                and_(column.is_(None), id_column < row_id)
+            ))
+        else:
+            query = query.filter(or_(
+                column < value,
+                and_(column == value, id_column < row_id)
+            ))
+    
+    items = query.order_by(column.desc().nulls_first(), id_column.desc()).limit(per_page + 1).all()
+    
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, column.key), getattr(last, id_column.key))
+    
+    return items, next_cursor
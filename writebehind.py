@@ -0,0 +1,209 @@
+"""Write-behind buffer for live chat messages.
+
+Requests hand messages to `message_writer.enqueue_message()` and return
+immediately; a background thread writes everything buffered since its last
+run as one multi-row INSERT into Message plus one batched UPDATE of each
+touched Interaction's end_time/duration, then commits once.
+
+Durability: a message is durable once the flush containing it commits,
+normally within MESSAGE_FLUSH_INTERVAL seconds. Buffered messages are
+flushed when the process exits normally (including gunicorn's graceful
+SIGTERM shutdown), but are lost if the process is killed outright or
+crashes. If the database is unavailable (or locked) the batch stays
+buffered for the next run; the buffer is bounded by MESSAGE_QUEUE_SIZE, so
+callers then get backpressure (QueueFull) rather than unbounded memory
+growth. Any other failure means a bad row (e.g. its interaction was deleted
+or archived meanwhile), so the batch is rewritten one message at a time: the
+good ones commit and each failing one is retried on later runs, then logged
+and dropped after MESSAGE_MAX_ATTEMPTS failed writes. Anything that must not
+be lost should be written synchronously instead.
+"""
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import bindparam, insert, or_, select, update
+from sqlalchemy.exc import OperationalError
+from app import db
+from dataversion import touch
+from models import Interaction, Message
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """The write-behind buffer stayed full for longer than the enqueue timeout"""
+
+
+class MessageWriter:
+    def __init__(self, max_pending=10000, flush_interval=0.5, batch_size=500, enqueue_timeout=1.0,
+                 max_attempts=3):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self.max_attempts = max_attempts
+        self.dropped = 0
+        self.app = None
+        self._messages = []
+        self._retries = []  # (message, failed writes) of messages that failed on their own
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.max_pending = app.config.get('MESSAGE_QUEUE_SIZE', self.max_pending)
+        self.flush_interval = app.config.get('MESSAGE_FLUSH_INTERVAL', self.flush_interval)
+        self.batch_size = app.config.get('MESSAGE_FLUSH_BATCH', self.batch_size)
+        self.max_attempts = app.config.get('MESSAGE_MAX_ATTEMPTS', self.max_attempts)
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        # Threads don't survive gunicorn's fork, so start one lazily in each worker
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+        self._thread.start()
+
+    def enqueue_message(self, interaction_id, sender_type, content, timestamp=None):
+        """Buffer a message for the next flush, blocking briefly while the buffer is full"""
+        timestamp = timestamp or datetime.utcnow()
+        with self._not_full:
+            self._ensure_started()
+            if not self._not_full.wait_for(lambda: self._pending() < self.max_pending, self.enqueue_timeout):
+                raise QueueFull(f"{self._pending()} messages waiting to be written")
+            self._messages.append({
+                'interaction_id': interaction_id,
+                'sender_type': sender_type,
+                'content': content,
+                'timestamp': timestamp,
+            })
+            pending = len(self._messages)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _pending(self):
+        return len(self._messages) + len(self._retries)
+
+    def pending(self):
+        with self._lock:
+            return self._pending()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Message flush failed; will retry")
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of messages written"""
+        with self._lock:
+            batch = self._retries + [(message, 0) for message in self._messages]
+            self._messages, self._retries = [], []
+        if not batch:
+            return 0
+
+        with self.app.app_context():
+            try:
+                self._write([message for message, _ in batch])
+                failed = []
+            except OperationalError:
+                self._requeue(batch)
+                raise
+            except Exception:
+                logger.exception(f"Writing {len(batch)} messages failed; retrying them one at a time")
+                failed = self._write_each(batch)
+        self._requeue(failed)
+        return len(batch) - len(failed)
+
+    def _write_each(self, batch):
+        """Write the messages one per transaction; returns the ones still to retry"""
+        failed = []
+        for index, (message, failures) in enumerate(batch):
+            try:
+                self._write([message])
+            except OperationalError:
+                # The database went away: not the message's fault, nor the rest's
+                return failed + batch[index:]
+            except Exception:
+                logger.warning(f"Message for interaction {message['interaction_id']} failed to write", exc_info=True)
+                failed.append((message, failures + 1))
+        return failed
+
+    def _requeue(self, batch):
+        retries = []
+        for message, failures in batch:
+            if failures >= self.max_attempts:
+                self.dropped += 1
+                logger.error(f"Dropping message after {failures} failed writes: {message!r}")
+            else:
+                retries.append((message, failures))
+        with self._not_full:
+            self._retries = retries + self._retries
+            self._not_full.notify_all()
+
+    def _write(self, messages):
+        # Each interaction's end time only needs its latest message
+        end_times = {}
+        for message in messages:
+            if message['timestamp'] > end_times.get(message['interaction_id'], datetime.min):
+                end_times[message['interaction_id']] = message['timestamp']
+
+        session = db.session
+        try:
+            session.execute(insert(Message), messages)
+
+            interactions = session.execute(
+                select(Interaction.id, Interaction.start_time, Interaction.business_id).where(Interaction.id.in_(end_times))
+            ).all()
+            start_times = {row.id: row.start_time for row in interactions}
+            updates = [
+                {
+                    'interaction_id': interaction_id,
+                    'new_end_time': end_time,
+                    'new_duration': int((end_time - start_times[interaction_id]).total_seconds())
+                    if start_times.get(interaction_id) else None,
+                }
+                for interaction_id, end_time in end_times.items()
+                if interaction_id in start_times
+            ]
+            if updates:
+                table = Interaction.__table__
+                # Never move an end time backwards if a later one was written meanwhile
+                session.execute(
+                    update(table).where(
+                        table.c.id == bindparam('interaction_id'),
+                        or_(table.c.end_time.is_(None), table.c.end_time < bindparam('new_end_time'))
+                    ).values(end_time=bindparam('new_end_time'), duration=bindparam('new_duration')),
+                    updates
+                )
+                touch(session, {row.business_id for row in interactions})
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is still buffered"""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        if self.app is not None:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception(f"Lost {self.pending()} buffered messages at shutdown")
+
+
+message_writer = MessageWriter()